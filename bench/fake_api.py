@@ -0,0 +1,127 @@
+# bench/fake_api.py
+# Локальная заглушка Telegram Bot API для нагрузочных тестов
+
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+
+from tornado.web import Application, RequestHandler
+from tornado.httpserver import HTTPServer
+
+BOT_INFO = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: отдает обновления через getUpdates и записывает ответы бота.
+
+    Ответы sendMessage сопоставляются с ожидающими их пользователями по chat_id,
+    поэтому задержка считается от постановки обновления в очередь до ответа бота.
+    """
+
+    def __init__(self, host="127.0.0.1", port=18081):
+        self.host = host
+        self.port = port
+        self.updates = []
+        self._next_update_id = 1
+        self._new_updates = asyncio.Event()
+        # chat_id -> очередь ответов бота (время, текст)
+        self._replies = {}
+        self.calls = {}
+        self.first_get_updates = None
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        app = Application([(r"/bot[^/]+/(\w+)", _MethodHandler, {"api": self})])
+        self._server = HTTPServer(app)
+        self._server.listen(self.port, self.host)
+
+    async def stop(self):
+        # Отпускаем висящий getUpdates, чтобы не обрывать его вместе с соединением
+        self._new_updates.set()
+        await asyncio.sleep(0.1)
+        self._server.stop()
+        await self._server.close_all_connections()
+
+    def make_update(self, user_id, text):
+        """Обновление с сообщением пользователя (для getUpdates или вебхука)"""
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"update_id": update_id, "message": message}
+
+    def push_message(self, user_id, text):
+        """Новое сообщение пользователя; возвращает время постановки в очередь"""
+        self.updates.append(self.make_update(user_id, text))
+        self._new_updates.set()
+        return time.perf_counter()
+
+    def replies(self, chat_id):
+        """Очередь ответов бота в чат"""
+        return self._replies.setdefault(chat_id, asyncio.Queue())
+
+    async def get_updates(self, params):
+        if self.first_get_updates is None:
+            self.first_get_updates = time.perf_counter()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Подтвержденные ботом обновления больше не нужны
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def send_message(self, params):
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        self.replies(chat_id).put_nowait((time.perf_counter(), text))
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    async def call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getUpdates":
+            return await self.get_updates(params)
+        if method == "sendMessage":
+            return self.send_message(params)
+        if method == "getMe":
+            return BOT_INFO
+        return True
+
+
+class _MethodHandler(RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, method):
+        body = self.request.body
+        if body.startswith(b"{"):
+            params = json.loads(body)
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        result = await self.api.call(method, params)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": result}))
+
+    get = post
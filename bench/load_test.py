@@ -0,0 +1,177 @@
+# bench/load_test.py
+# Нагрузочный тест: N пользователей одновременно проходят опрос и оставляют отзыв.
+#
+# Бот запускается отдельным процессом (python main.py) против локальной заглушки
+# Bot API в пустой временной папке, поэтому тест работает без сети и токена.
+#
+#   python bench/load_test.py --users 200 --json results/load.json
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import resource
+import tempfile
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_api import FakeBotAPI
+from questions import RESPONSES
+
+# Ответы пользователя по сценариям из questions.FLOWS
+SURVEY = [
+    "/start",
+    "Пройти опрос",
+    "Иван Иванов",
+    "ivan@example.com",
+    "+375291234567",
+    "Да",
+    "1 ступень",
+    "2 ступень",
+    "Завершить выбор",
+    "Тренер 1",
+    "Да",
+    "Семейная гештальт-терапия",
+    "Завершить выбор",
+    "Тренер 2",
+    "Онлайн конференция",
+    "Другое",
+    "Вебинар",
+    "Все понравилось",
+    "✅ Подтверждаю",
+    "✅ Согласен(-на)",
+]
+REVIEW = [
+    "Оставить отзыв",
+    "Основная программа",
+    "Тренер 1",
+    "9",
+    "Отличный курс",
+    "✅ Согласен(-на)",
+]
+SCRIPT = SURVEY + REVIEW
+
+
+def percentile(values, q):
+    """Перцентиль q (0-100) по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def simulate_user(api, user_id, think_time, reply_timeout, latencies, results):
+    """Один пользователь: отправка сообщения и ожидание ответа бота"""
+    replies = api.replies(user_id)
+    for text in SCRIPT:
+        sent = api.push_message(user_id, text)
+        try:
+            received, reply = await asyncio.wait_for(replies.get(), reply_timeout)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+            return
+        latencies.append(received - sent)
+        if reply == RESPONSES["survey_success"]:
+            results["surveys"] += 1
+        elif reply == RESPONSES["review_success"]:
+            results["reviews"] += 1
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-load-")
+    api = FakeBotAPI(port=args.port)
+    api.start()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123456:bench",
+        TELEGRAM_API_URL=api.url,
+        BOT_MODE="polling",
+    )
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    started = time.perf_counter()
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir, env=env, stdout=log, stderr=log
+    )
+    try:
+        while api.first_get_updates is None:
+            if bot.returncode is not None:
+                raise RuntimeError(f"Bot exited with code {bot.returncode}, see {log.name}")
+            await asyncio.sleep(0.01)
+        startup = api.first_get_updates - started
+
+        latencies = []
+        results = {"surveys": 0, "reviews": 0, "timeouts": 0}
+        load_started = time.perf_counter()
+        await asyncio.gather(*(
+            simulate_user(api, 1000 + i, args.think_ms / 1000, args.timeout, latencies, results)
+            for i in range(args.users)
+        ))
+        duration = time.perf_counter() - load_started
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            await bot.wait()
+        log.close()
+        await api.stop()
+
+    latencies.sort()
+    return {
+        "users": args.users,
+        "messages": len(latencies),
+        "surveys": results["surveys"],
+        "reviews": results["reviews"],
+        "timeouts": results["timeouts"],
+        "startup_s": round(startup, 3),
+        "duration_s": round(duration, 3),
+        "throughput_msg_s": round(len(latencies) / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        # ru_maxrss дочерних процессов в Linux - в килобайтах
+        "bot_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "api_calls": api.calls,
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с заглушкой Bot API")
+    parser.add_argument("--users", type=int, default=100, help="число одновременных пользователей")
+    parser.add_argument("--think-ms", type=int, default=0, help="пауза пользователя между ответами, мс")
+    parser.add_argument("--timeout", type=float, default=30, help="ожидание ответа бота, секунды")
+    parser.add_argument("--port", type=int, default=18081, help="порт заглушки Bot API")
+    parser.add_argument("--workdir", help="рабочая папка бота (по умолчанию временная)")
+    parser.add_argument("--json", help="файл для результатов в формате JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    latency = report["latency_ms"]
+    print(f"users:      {report['users']} ({report['surveys']} surveys, {report['reviews']} reviews, "
+          f"{report['timeouts']} timeouts)")
+    print(f"startup:    {report['startup_s']} s to first getUpdates")
+    print(f"throughput: {report['throughput_msg_s']} msg/s ({report['messages']} in {report['duration_s']} s)")
+    print(f"latency:    p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+          f"max {latency['max']} ms")
+    print(f"peak RSS:   {report['bot_peak_rss_mb']} MB")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report["timeouts"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
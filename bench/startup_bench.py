@@ -0,0 +1,144 @@
+# bench/startup_bench.py
+# Время запуска бота: импорт main, сборка приложения и первый getUpdates.
+#
+# Каждый замер - новый процесс интерпретатора в пустой временной папке.
+# Если после запуска в процессе бота оказались тяжелые модули (pandas,
+# numpy, openpyxl), скрипт завершается с кодом 1 - так ленивый импорт
+# не потеряется незаметно.
+#
+#   python bench/startup_bench.py --runs 10 --json results/startup.json
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+from fake_api import FakeBotAPI
+
+# Модули, которые нужны только выгрузке в Excel
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+
+ENV = {"TELEGRAM_BOT_TOKEN": "123456:bench", "BOT_MODE": "polling"}
+
+PROBE = """
+import sys, time, json, resource
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+imported = time.perf_counter()
+main.build_application()
+built = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "build_ms": (built - imported) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe_import(workdir):
+    """Импорт main и сборка приложения в новом процессе"""
+    code = PROBE.format(root=ROOT, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, env=dict(os.environ, **ENV),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def process_rss_mb(pid):
+    """Текущий RSS процесса по /proc (только Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def probe_first_get_updates(workdir, port):
+    """Запуск python main.py до первого getUpdates"""
+    api = FakeBotAPI(port=port)
+    api.start()
+    env = dict(os.environ, TELEGRAM_API_URL=api.url, **ENV)
+    started = time.perf_counter()
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while api.first_get_updates is None:
+            if bot.returncode is not None:
+                raise RuntimeError(f"Bot exited with code {bot.returncode}")
+            await asyncio.sleep(0.005)
+        return {
+            "first_get_updates_ms": (api.first_get_updates - started) * 1000,
+            "rss_mb": process_rss_mb(bot.pid),
+        }
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            await bot.wait()
+        await api.stop()
+
+
+def summary(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        "min": round(min(values), 1),
+        "median": round(statistics.median(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска бота")
+    parser.add_argument("--runs", type=int, default=5, help="число запусков")
+    parser.add_argument("--port", type=int, default=18082, help="порт заглушки Bot API")
+    parser.add_argument("--json", help="файл для результатов в формате JSON")
+    args = parser.parse_args()
+
+    imports, starts, heavy = [], [], set()
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="bot-startup-") as workdir:
+            result = probe_import(workdir)
+            imports.append(result)
+            heavy.update(result["heavy"])
+        with tempfile.TemporaryDirectory(prefix="bot-startup-") as workdir:
+            starts.append(asyncio.run(probe_first_get_updates(workdir, args.port)))
+
+    report = {
+        "runs": args.runs,
+        "import_ms": summary([r["import_ms"] for r in imports]),
+        "build_ms": summary([r["build_ms"] for r in imports]),
+        "import_rss_mb": summary([r["rss_mb"] for r in imports]),
+        "first_get_updates_ms": summary([r["first_get_updates_ms"] for r in starts]),
+        "running_rss_mb": summary([r["rss_mb"] for r in starts]),
+        "heavy_modules": sorted(heavy),
+    }
+    for key in ("import_ms", "build_ms", "first_get_updates_ms", "import_rss_mb", "running_rss_mb"):
+        print(f"{key:22} {report[key]}")
+    print(f"{'heavy_modules':22} {report['heavy_modules'] or 'none'}")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# bench/storage_bench.py
+# Микробенчмарк хранилища: цена сохранения в зависимости от размера месячного файла.
+#
+# Для каждого хранилища и размера (по умолчанию 1k, 10k и 100k строк) файл месяца
+# заполняется синтетическими записями с полями из storage.FIELDS, после чего
+# замеряются одиночные сохранения, пачки как у фоновой записи и выгрузка в Excel.
+# Хранилище xlsx - прежняя схема (прочитать книгу, дописать строку, перезаписать),
+# оставлена как точка отсчета.
+#
+#   python bench/storage_bench.py --json results/storage.json
+#   python bench/storage_bench.py --backends sqlite --sizes 100000 --ops single,batch
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import storage
+from questions import OPTIONS
+
+BACKENDS = ("xlsx", "journal", "sqlite")
+OPERATIONS = ("single", "batch", "export")
+MONTH = "202401"
+
+# Варианты множественного выбора для полей-списков
+LIST_OPTIONS = {
+    "current_level": OPTIONS["levels"],
+    "studied_levels": OPTIONS["levels"],
+    "spec_list_now": OPTIONS["specializations"],
+    "spec_list_before": OPTIONS["specializations"],
+    "events": OPTIONS["events"],
+}
+WORDS = (
+    "курс", "тренер", "группа", "занятие", "практика", "терапия", "опыт",
+    "понравилось", "интересно", "полезно", "спасибо", "хотелось", "больше",
+)
+
+
+def synthetic_record(kind, rng, index):
+    """Запись с полями из storage.FIELDS и правдоподобными значениями"""
+    started = datetime(2024, 1, 1) + timedelta(seconds=index * 30)
+    record = {}
+    for name, field_type in storage.FIELDS[kind].items():
+        if name in ("date", "timestamp"):
+            value = started.strftime("%Y-%m-%d %H:%M:%S")
+        elif name == "telegram_id":
+            value = 100000000 + index
+        elif name == "rating":
+            value = rng.randint(1, 10)
+        elif field_type == "INTEGER":
+            value = rng.randint(0, 1000)
+        elif field_type == "BOOL":
+            value = rng.random() < 0.9
+        elif field_type == "LIST":
+            options = LIST_OPTIONS.get(name, OPTIONS["levels"])
+            value = rng.sample(options, rng.randint(1, min(3, len(options))))
+        elif name in ("feedback", "results"):
+            value = " ".join(rng.choices(WORDS, k=rng.randint(5, 40)))
+        else:
+            value = " ".join(rng.choices(WORDS, k=rng.randint(1, 3)))
+        record[name] = value
+    return record
+
+
+def flatten(record):
+    """Запись в виде строки Excel: списки через запятую"""
+    return {key: ", ".join(value) if isinstance(value, list) else value for key, value in record.items()}
+
+
+def legacy_save(kind, items, month=None):
+    """Прежнее сохранение: чтение всей книги, дозапись и перезапись файла"""
+    import pandas as pd
+
+    filename = storage.excel_path(kind, month)
+    df = pd.DataFrame([flatten(storage.prepare_record(data)) for data in items])
+    if os.path.exists(filename):
+        df = pd.concat([pd.read_excel(filename), df], ignore_index=True)
+    df.to_excel(filename, index=False)
+    return True
+
+
+def prepopulate(backend, kind, rows, rng):
+    """Заполнение месячного файла (или таблицы) синтетическими строками"""
+    records = [synthetic_record(kind, rng, i) for i in range(rows)]
+    if backend == "xlsx":
+        import pandas as pd
+
+        pd.DataFrame([flatten(record) for record in records]).to_excel(
+            storage.excel_path(kind, MONTH), index=False
+        )
+    else:
+        storage.get_store().save_records(kind, records, MONTH)
+
+
+def data_size(path):
+    """Размер файлов с данными, байты"""
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def timings(samples, records):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "per_record_ms": round(statistics.fmean(samples) * 1000 / records, 4),
+    }
+
+
+def run_case(backend, kind, rows, args):
+    """Замеры одного хранилища на одном размере файла"""
+    rng = random.Random(rows)
+    workdir = tempfile.mkdtemp(prefix="storage-bench-")
+    storage.DATA_DIR = workdir
+    results = []
+    try:
+        if backend != "xlsx":
+            storage.init(backend)
+        started = time.perf_counter()
+        prepopulate(backend, kind, rows, rng)
+        prepare_s = time.perf_counter() - started
+        save = legacy_save if backend == "xlsx" else storage.save_records
+        base = {"backend": backend, "kind": kind, "rows": rows}
+
+        if "single" in args.ops:
+            samples = []
+            for i in range(args.single):
+                record = synthetic_record(kind, rng, rows + i)
+                started = time.perf_counter()
+                if not save(kind, [record], MONTH):
+                    raise RuntimeError(f"{backend} save failed")
+                samples.append(time.perf_counter() - started)
+            results.append({**base, "op": "single", **timings(samples, 1)})
+
+        if "batch" in args.ops:
+            samples = []
+            for i in range(args.batches):
+                batch = [
+                    synthetic_record(kind, rng, rows + args.single + i * args.batch_size + j)
+                    for j in range(args.batch_size)
+                ]
+                started = time.perf_counter()
+                if not save(kind, batch, MONTH):
+                    raise RuntimeError(f"{backend} save failed")
+                samples.append(time.perf_counter() - started)
+            results.append({
+                **base, "op": "batch", "batch_size": args.batch_size,
+                **timings(samples, args.batch_size),
+            })
+
+        # Для xlsx книга и есть выгрузка - отдельного шага нет
+        if "export" in args.ops and backend != "xlsx":
+            started = time.perf_counter()
+            storage.export_to_excel(kind, MONTH)
+            elapsed = time.perf_counter() - started
+            results.append({**base, "op": "export", **timings([elapsed], rows)})
+
+        for result in results:
+            result["prepare_s"] = round(prepare_s, 3)
+            result["data_bytes"] = data_size(workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк записи результатов")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="хранилища через запятую")
+    parser.add_argument("--kinds", default="survey,review", help="типы записей через запятую")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="размеры файла месяца, строк")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="замеры: single, batch, export")
+    parser.add_argument("--single", type=int, default=20, help="число одиночных сохранений")
+    parser.add_argument("--batches", type=int, default=5, help="число пачек")
+    parser.add_argument("--batch-size", type=int, default=50, help="записей в пачке")
+    parser.add_argument(
+        "--xlsx-max", type=int, default=10000,
+        help="наибольший размер для xlsx: каждое сохранение перезаписывает всю книгу",
+    )
+    parser.add_argument("--json", help="файл для результатов в формате JSON")
+    args = parser.parse_args()
+    args.ops = args.ops.split(",")
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for kind in args.kinds.split(","):
+        for rows in (int(size) for size in args.sizes.split(",")):
+            for backend in args.backends.split(","):
+                if backend == "xlsx" and rows > args.xlsx_max:
+                    continue
+                for result in run_case(backend, kind, rows, args):
+                    results.append(result)
+                    print(
+                        f"{result['kind']:6} {result['backend']:7} {result['rows']:>7} "
+                        f"{result['op']:6} mean {result['mean_ms']:>10.3f} ms  "
+                        f"p95 {result['p95_ms']:>10.3f} ms  per record {result['per_record_ms']:>9.4f} ms"
+                    )
+
+    if args.json:
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# bench/worker_scaling.py
+# Пропускная способность вебхука при 1..N процессах бота за маршрутизатором.
+#
+# Для каждого числа процессов запускаются процессы main.py (BOT_MODE=worker) с общим
+# хранилищем сессий, маршрутизатор sharding.Router и заглушка Bot API; пользователи
+# проходят опрос и отзыв, отправляя обновления в маршрутизатор как Telegram.
+# Ограничения на отправку сообщений сняты - измеряется обработка обновлений.
+#
+#   python bench/worker_scaling.py --workers 4 --users 200 --json results/scaling.json
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_api import FakeBotAPI
+from load_test import SCRIPT, percentile
+from sharding import Router
+
+
+def port_open(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+async def simulate_user(api, client, url, user_id, reply_timeout, latencies, results):
+    """Один пользователь: обновление в маршрутизатор и ожидание ответа бота"""
+    replies = api.replies(user_id)
+    for text in SCRIPT:
+        sent = time.perf_counter()
+        response = await client.post(url, json=api.make_update(user_id, text))
+        if response.status_code != 200:
+            results["errors"] += 1
+            return
+        try:
+            received, _ = await asyncio.wait_for(replies.get(), reply_timeout)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+            return
+        latencies.append(received - sent)
+
+
+async def run_workers(args, count):
+    """Один замер с count процессами бота"""
+    workdir = tempfile.mkdtemp(prefix=f"bot-workers-{count}-")
+    api = FakeBotAPI(port=args.port)
+    api.start()
+    ports = [args.port + 10 + i for i in range(count)]
+    router = Router([f"http://127.0.0.1:{port}/telegram" for port in ports])
+    router.start(args.port + 1, "127.0.0.1")
+
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    workers = []
+    for worker_id, port in enumerate(ports):
+        env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN="123456:bench",
+            TELEGRAM_API_URL=api.url,
+            BOT_MODE="worker",
+            WORKER_ID=str(worker_id),
+            WEBHOOK_LISTEN="127.0.0.1",
+            WEBHOOK_PORT=str(port),
+            SESSION_BACKEND="sqlite",
+            SEND_RATE="100000",
+            SEND_CHAT_RATE="100000",
+            SEND_CHAT_BURST="100000",
+        )
+        workers.append(await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir, env=env, stdout=log, stderr=log
+        ))
+    try:
+        while not all(port_open(port) for port in ports):
+            if any(worker.returncode is not None for worker in workers):
+                raise RuntimeError(f"Worker exited, see {log.name}")
+            await asyncio.sleep(0.05)
+
+        latencies = []
+        results = {"timeouts": 0, "errors": 0}
+        url = f"http://127.0.0.1:{args.port + 1}/telegram"
+        limits = httpx.Limits(max_connections=args.users)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                simulate_user(api, client, url, 1000 + i, args.timeout, latencies, results)
+                for i in range(args.users)
+            ))
+            duration = time.perf_counter() - started
+    finally:
+        for worker in workers:
+            if worker.returncode is None:
+                worker.send_signal(signal.SIGINT)
+        for worker in workers:
+            await worker.wait()
+        log.close()
+        await router.stop()
+        await api.stop()
+
+    latencies.sort()
+    return {
+        "workers": count,
+        "messages": len(latencies),
+        "timeouts": results["timeouts"],
+        "errors": results["errors"],
+        "duration_s": round(duration, 3),
+        "throughput_msg_s": round(len(latencies) / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование бота по числу процессов")
+    parser.add_argument("--workers", type=int, default=4, help="наибольшее число процессов бота")
+    parser.add_argument("--users", type=int, default=200, help="число одновременных пользователей")
+    parser.add_argument("--timeout", type=float, default=30, help="ожидание ответа бота, секунды")
+    parser.add_argument("--port", type=int, default=18081, help="порт заглушки Bot API")
+    parser.add_argument("--json", help="файл для результатов в формате JSON")
+    args = parser.parse_args()
+
+    reports = []
+    for count in range(1, args.workers + 1):
+        report = asyncio.run(run_workers(args, count))
+        reports.append(report)
+        latency = report["latency_ms"]
+        print(f"{count} workers: {report['throughput_msg_s']} msg/s, p50 {latency['p50']} ms, "
+              f"p99 {latency['p99']} ms ({report['timeouts']} timeouts, {report['errors']} errors)")
+    base = reports[0]["throughput_msg_s"]
+    if base:
+        print("speedup: " + ", ".join(
+            f"{report['workers']}: {report['throughput_msg_s'] / base:.2f}x" for report in reports
+        ))
+    print(f"cpu count: {os.cpu_count()}")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "runs": reports}, f, ensure_ascii=False, indent=2)
+    return 0 if all(not report["timeouts"] and not report["errors"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# broadcast.py
+# Рассылка сообщений пользователям, согласившимся на уведомления
+
+import os
+import time
+import asyncio
+import logging
+
+from telegram.error import Forbidden, TelegramError
+
+from outbound import PRIORITY_BULK
+from storage import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+# Статусы получателя
+PENDING = "pending"
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+STATUSES = (PENDING, DELIVERED, BLOCKED, FAILED)
+
+
+class BroadcastStore:
+    """Рассылки и статусы получателей в SQLite - по ним прерванная рассылка продолжается"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join("data", "broadcasts.db")
+        self.connection = ThreadConnections(self.path)
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS broadcasts "
+                "(id INTEGER PRIMARY KEY, text TEXT NOT NULL, chat_id INTEGER, "
+                "created REAL NOT NULL, finished REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recipients "
+                "(broadcast_id INTEGER NOT NULL, telegram_id INTEGER NOT NULL, "
+                "status TEXT NOT NULL, error TEXT, PRIMARY KEY (broadcast_id, telegram_id))"
+            )
+
+    def create(self, text, chat_id, recipients):
+        """Новая рассылка; возвращает ее номер"""
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO broadcasts (text, chat_id, created) VALUES (?, ?, ?)",
+                (text, chat_id, time.time()),
+            )
+            broadcast_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO recipients (broadcast_id, telegram_id, status) VALUES (?, ?, ?)",
+                [(broadcast_id, telegram_id, PENDING) for telegram_id in recipients],
+            )
+        return broadcast_id
+
+    def unfinished(self):
+        """Незавершенные рассылки: (номер, текст, чат для отчета)"""
+        return self.connection().execute(
+            "SELECT id, text, chat_id FROM broadcasts WHERE finished IS NULL ORDER BY id"
+        ).fetchall()
+
+    def pending(self, broadcast_id):
+        """Получатели, которым сообщение еще не отправлялось"""
+        rows = self.connection().execute(
+            "SELECT telegram_id FROM recipients WHERE broadcast_id = ? AND status = ?",
+            (broadcast_id, PENDING),
+        )
+        return [row[0] for row in rows]
+
+    def save_results(self, broadcast_id, results):
+        """Запись статусов пачки получателей: [(telegram_id, статус, ошибка)]"""
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "UPDATE recipients SET status = ?, error = ? WHERE broadcast_id = ? AND telegram_id = ?",
+                [(status, error, broadcast_id, telegram_id) for telegram_id, status, error in results],
+            )
+
+    def finish(self, broadcast_id):
+        conn = self.connection()
+        with conn:
+            conn.execute("UPDATE broadcasts SET finished = ? WHERE id = ?", (time.time(), broadcast_id))
+
+    def counts(self, broadcast_id):
+        """Число получателей по статусам"""
+        counts = dict.fromkeys(STATUSES, 0)
+        rows = self.connection().execute(
+            "SELECT status, COUNT(*) FROM recipients WHERE broadcast_id = ? GROUP BY status",
+            (broadcast_id,),
+        )
+        counts.update(dict(rows.fetchall()))
+        return counts
+
+    def last_id(self):
+        row = self.connection().execute("SELECT MAX(id) FROM broadcasts").fetchone()
+        return row[0]
+
+
+class Broadcaster:
+    """Одновременная отправка рассылки в пределах лимитов планировщика.
+
+    Статусы сохраняются пачками по checkpoint_size; после перезапуска
+    рассылка продолжается с получателей, статус которых не успел записаться
+    (им сообщение может прийти повторно).
+    """
+
+    def __init__(self, store, concurrency=30, checkpoint_size=100, on_finish=None):
+        self.store = store
+        self.concurrency = concurrency
+        self.checkpoint_size = checkpoint_size
+        # on_finish(bot, номер рассылки, чат для отчета, статусы) - отчет администратору
+        self.on_finish = on_finish
+        self.broadcast_id = None
+        self._results = []
+        self._task = None
+
+    @property
+    def active(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot, text, chat_id, recipients):
+        """Запуск новой рассылки; None, если другая еще идет"""
+        if self.active:
+            return None
+        broadcast_id = await asyncio.to_thread(self.store.create, text, chat_id, recipients)
+        self._task = asyncio.create_task(self._run(bot, broadcast_id, text, chat_id))
+        return broadcast_id
+
+    def resume(self, bot):
+        """Продолжение в фоне рассылок, прерванных остановкой бота"""
+        unfinished = self.store.unfinished()
+        if unfinished and not self.active:
+            self._task = asyncio.create_task(self._resume(bot, unfinished))
+
+    async def _resume(self, bot, unfinished):
+        for broadcast_id, text, chat_id in unfinished:
+            logger.info(f"Resuming broadcast {broadcast_id}")
+            await self._run(bot, broadcast_id, text, chat_id)
+
+    async def stop(self):
+        """Остановка с сохранением статусов; рассылка продолжится при следующем запуске"""
+        if self.active:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def counts(self, broadcast_id=None):
+        """Статусы получателей текущей (или последней) рассылки"""
+        broadcast_id = broadcast_id or self.broadcast_id or await asyncio.to_thread(self.store.last_id)
+        if broadcast_id is None:
+            return None, None
+        await self._checkpoint()
+        return broadcast_id, await asyncio.to_thread(self.store.counts, broadcast_id)
+
+    async def _send(self, bot, telegram_id, text):
+        try:
+            await bot.send_message(telegram_id, text, rate_limit_args=PRIORITY_BULK)
+            return DELIVERED, None
+        except Forbidden as e:
+            # Пользователь заблокировал бота
+            return BLOCKED, str(e)
+        except TelegramError as e:
+            return FAILED, str(e)
+
+    async def _checkpoint(self):
+        if not self._results or self.broadcast_id is None:
+            return
+        batch, self._results = self._results, []
+        await asyncio.to_thread(self.store.save_results, self.broadcast_id, batch)
+
+    async def _run(self, bot, broadcast_id, text, chat_id):
+        self.broadcast_id = broadcast_id
+        recipients = iter(await asyncio.to_thread(self.store.pending, broadcast_id))
+
+        async def worker():
+            # Общий итератор: каждый получатель достается одному обработчику
+            for telegram_id in recipients:
+                status, error = await self._send(bot, telegram_id, text)
+                self._results.append((telegram_id, status, error))
+                if len(self._results) >= self.checkpoint_size:
+                    await self._checkpoint()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            await self._checkpoint()
+        await asyncio.to_thread(self.store.finish, broadcast_id)
+        counts = await asyncio.to_thread(self.store.counts, broadcast_id)
+        logger.info(f"Broadcast {broadcast_id} finished: {counts}")
+        if self.on_finish:
+            await self.on_finish(bot, broadcast_id, chat_id, counts)
@@ -0,0 +1,111 @@
+# content.py
+# Тексты, меню и сценарии бота в виде неизменяемых снимков с подменой без перезапуска.
+#
+# Снимок собирается из файла с теми же именами, что и questions.py (по умолчанию -
+# из самого questions.py): клавиатуры, ответы меню и таблица переходов опроса
+# готовятся один раз, обработчики только берут готовые объекты из current.
+# Новый снимок собирается и проверяется целиком и подменяет старый одним
+# присваиванием, поэтому обработчик видит либо старые, либо новые тексты.
+
+import os
+import time
+import runpy
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from telegram import ReplyKeyboardMarkup
+
+import sessions
+from survey import compile_flows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.py")
+
+
+@dataclass(frozen=True)
+class Content:
+    """Снимок текстов и клавиатур"""
+    welcome: str
+    main_menu: ReplyKeyboardMarkup
+    # текст кнопки главного меню -> ответ
+    menu_replies: MappingProxyType
+    responses: MappingProxyType
+    choice_mark: str
+    # поле с множественным выбором -> таблица вариантов
+    choices: MappingProxyType
+    # сценарии и шаги, скомпилированные survey.compile_flows
+    flows: MappingProxyType
+    table: MappingProxyType
+    mtime: float
+    loaded: float
+
+
+def load(path=None):
+    """Сборка снимка из файла с текстами"""
+    path = path or DEFAULT_PATH
+    mtime = os.stat(path).st_mtime
+    namespace = runpy.run_path(path)
+    keyboards = namespace["KEYBOARDS"]
+    menu = namespace["MAIN_MENU_TEXTS"]
+    choices = sessions.choice_tables(namespace["FLOWS"], namespace["OPTIONS"])
+    flows, table = compile_flows(namespace["FLOWS"], keyboards, choices)
+    return Content(
+        welcome=namespace["WELCOME_MESSAGE"],
+        main_menu=ReplyKeyboardMarkup(keyboards["main_menu"], resize_keyboard=True, one_time_keyboard=True),
+        menu_replies=MappingProxyType({menu[key]: text for key, text in namespace["MENU_ANSWERS"].items()}),
+        responses=MappingProxyType(dict(namespace["RESPONSES"])),
+        choice_mark=namespace["CHOICE_MARK"],
+        choices=MappingProxyType(choices),
+        flows=MappingProxyType(flows),
+        table=MappingProxyType(table),
+        mtime=mtime,
+        loaded=time.time(),
+    )
+
+
+class ContentStore:
+    """Текущий снимок текстов и его перезагрузка из файла.
+
+    На лету можно менять тексты, кнопки, ссылки и переходы между
+    вопросами, а варианты множественного выбора - только дополнять.
+    Добавление и удаление вопросов требует перезапуска: состояния
+    разговоров задаются при создании ConversationHandler.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_PATH
+        self.current = load(self.path)
+        # таблицы вариантов берутся из загруженного файла, а не из questions.py
+        sessions.check_options(self.current.choices, extend_only=False)
+        sessions.set_options(self.current.choices)
+        # mtime последней попытки загрузки, чтобы не повторять неудачную
+        self._seen = self.current.mtime
+
+    def apply(self, snapshot):
+        """Проверка и подмена снимка; ValueError, если изменения требуют перезапуска"""
+        if snapshot.table.keys() != self.current.table.keys():
+            raise ValueError("Questions were added or removed, restart the bot to apply")
+        sessions.check_options(snapshot.choices)
+        sessions.set_options(snapshot.choices)
+        self.current = snapshot
+
+    async def reload(self):
+        """Загрузка файла заново (в потоке) и подмена снимка"""
+        try:
+            self._seen = os.stat(self.path).st_mtime
+        except OSError:
+            pass
+        snapshot = await asyncio.to_thread(load, self.path)
+        self.apply(snapshot)
+        logger.info(f"Content reloaded from {self.path}")
+        return snapshot
+
+    def changed(self):
+        """Изменился ли файл с прошлой загрузки"""
+        try:
+            return os.stat(self.path).st_mtime != self._seen
+        except OSError:
+            return False
@@ -0,0 +1,107 @@
+# export.py
+# Потоковая выгрузка записей за период в xlsx (write-only) или csv.gz.
+#
+# Строки читаются из хранилища по одной и сразу пишутся в файл, поэтому
+# память не растет с числом записей. Бот запускает выгрузку отдельным
+# процессом, чтобы openpyxl не загружался в процесс бота:
+#   python export.py survey 2024-01-01 2024-12-31 xlsx data/exports/survey.xlsx
+
+import os
+import csv
+import sys
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("xlsx", "csv")
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def iter_period(kind, start, end):
+    """Записи, отправленные в [start, end), по месяцам из хранилища.
+
+    Месяц хранилища - месяц отправки, поэтому фильтр идет по timestamp, а не по
+    date (началу заполнения): иначе анкета, начатая в конце месяца и отправленная
+    в начале следующего, не попала бы ни в одну помесячную выгрузку.
+    """
+    first, last = start.strftime("%Y%m"), (end - timedelta(seconds=1)).strftime("%Y%m")
+    low, high = start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")
+    for month in storage.get_store().months(kind):
+        if not first <= month <= last:
+            continue
+        for record in storage.iter_records(kind, month=month):
+            sent = str(record.get("timestamp") or record.get("date") or "")
+            if low <= sent < high:
+                yield record
+
+
+def _cell(value):
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _rows(kind, records):
+    columns = list(storage.FIELDS[kind])
+    for record in records:
+        yield [_cell(record.get(column)) for column in columns]
+
+
+def write_xlsx(path, kind, records):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    sheet.append(list(storage.FIELDS[kind]))
+    count = 0
+    for row in _rows(kind, records):
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def write_csv(path, kind, records):
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(storage.FIELDS[kind])
+        for row in _rows(kind, records):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export_period(kind, start, end, fmt, path):
+    """Выгрузка записей за период; возвращает число строк"""
+    write = write_xlsx if fmt == "xlsx" else write_csv
+    tmp = f"{path}.part"
+    try:
+        count = write(tmp, kind, iter_period(kind, start, end))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    logger.info(f"Exported {count} {kind} rows for {start:%Y-%m-%d}..{end:%Y-%m-%d} to {path}")
+    return count
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+    kind, start, end, fmt, path = sys.argv[1:6]
+    start = datetime.strptime(start, DATE_FORMAT)
+    # Конец периода включительно
+    end = datetime.strptime(end, DATE_FORMAT) + timedelta(days=1)
+    # Число строк - в stdout для бота
+    print(export_period(kind, start, end, fmt, path))
@@ -1,22 +1,117 @@
 import os
 import re
+import sys
+import signal
 import logging
-import pandas as pd
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update
 from telegram.ext import (
     Application,
+    ExtBot,
     CommandHandler,
     MessageHandler,
+    CallbackQueryHandler,
     ConversationHandler,
     filters,
     CallbackContext,
 )
 
+import storage
+import export
+import metrics
+import profiling
+from ordering import OrderedApplication
+from writer import SubmissionWriter
+from outbound import SendScheduler
+from broadcast import BroadcastStore, Broadcaster
+from stats import ReviewStats
+from sessions import SessionStore
+from persistence import SessionPersistence
+from shared import SqliteStateBackend, SharedState
+from webhook import WebhookReplies, WebhookServer
+from survey import SurveyEngine
+from content import ContentStore
+from questions import ADMIN_RESPONSES
+
 # Загрузка переменных окружения
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Адрес Bot API (для локальной заглушки), например http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+# Режим получения обновлений: polling, webhook или worker (за маршрутизатором sharding.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Настройки вебхука
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Сколько ждать обработки обновления, чтобы вернуть ответ в теле ответа на вебхук, мс
+WEBHOOK_REPLY_MS = int(os.getenv("WEBHOOK_REPLY_MS", "500"))
+# Хранилище результатов: sqlite или journal
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+# Период выгрузки результатов в Excel, секунды
+EXPORT_INTERVAL = int(os.getenv("EXPORT_INTERVAL", "600"))
+# Группировка сохранений: сбрасываем пачку по числу записей или по времени (мс)
+WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "50"))
+WRITER_BATCH_MS = int(os.getenv("WRITER_BATCH_MS", "200"))
+# Ограничения хранилища сессий: число сессий и время простоя (секунды)
+SESSION_MAX_SIZE = int(os.getenv("SESSION_MAX_SIZE", "10000"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(6 * 60 * 60)))
+# Через сколько секунд без ответа опрос или отзыв считается брошенным (0 - никогда),
+# и как часто брошенные ответы записываются в хранилище незавершенных
+CONVERSATION_TIMEOUT = int(os.getenv("CONVERSATION_TIMEOUT", str(60 * 60)))
+SWEEP_INTERVAL = int(os.getenv("SWEEP_INTERVAL", "60"))
+# Период записи контрольных точек сессий и состояний разговоров, секунды
+PERSISTENCE_INTERVAL = int(os.getenv("PERSISTENCE_INTERVAL", "5"))
+# Хранение сессий и состояний разговоров: local (память процесса и контрольные точки)
+# или sqlite (общая база, для нескольких процессов бота)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "local")
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", os.path.join("data", "shared_state.db"))
+# Период удаления истекших состояний из общей базы, секунды
+SHARED_CLEANUP_INTERVAL = int(os.getenv("SHARED_CLEANUP_INTERVAL", "600"))
+# Номер процесса бота; продолжение прерванных рассылок выполняет процесс 0
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+# Исходящие сообщения: общий лимит бота и лимит личного чата (в секунду), запас на всплеск.
+# Лимит действует в пределах процесса: при нескольких процессах общий лимит делится между ними
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+# Наибольший размер файла, который бот может отправить, байты
+DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+# Одновременных отправок при рассылке
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))
+# Порт HTTP-сервера метрик Prometheus (0 - не запускать)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+# Telegram ID администраторов через запятую
+ADMIN_IDS = [int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()]
+# Порог медленного обновления для журнала, мс
+SLOW_UPDATE_MS = int(os.getenv("SLOW_UPDATE_MS", "1000"))
+# Наибольшая длительность профилирования по команде, секунды
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# Сколько обновлений разных пользователей обрабатывается одновременно (1 - по одному)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+# Файл с текстами, меню и сценариями (по умолчанию questions.py) и период проверки
+# его изменений, секунды (0 - только по команде /reload)
+CONTENT_PATH = os.getenv("CONTENT_PATH")
+CONTENT_CHECK_INTERVAL = int(os.getenv("CONTENT_CHECK_INTERVAL", "5"))
+# Пулы соединений с Bot API: ответы пользователям и рассылки (getUpdates - отдельное соединение).
+# Размер рассылочного пула по умолчанию - число одновременных отправок рассылки
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "256"))
+API_BULK_POOL_SIZE = int(os.getenv("API_BULK_POOL_SIZE", str(BROADCAST_CONCURRENCY)))
+# Сколько держать открытым простаивающее соединение, секунды
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+# Таймауты запросов к Bot API, секунды; API_POOL_TIMEOUT - ожидание свободного соединения
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "5"))
+API_WRITE_TIMEOUT = float(os.getenv("API_WRITE_TIMEOUT", "5"))
+API_POOL_TIMEOUT = float(os.getenv("API_POOL_TIMEOUT", "1"))
+# Версия HTTP для Bot API: 1.1 или 2 (по HTTP/2 запросы идут через одно соединение)
+API_HTTP_VERSION = os.getenv("API_HTTP_VERSION", "1.1")
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,810 +123,505 @@ logger = logging.getLogger(__name__)
 # Создаем папку для данных, если ее нет
 os.makedirs("data", exist_ok=True)
 
-# Состояния разговора
-(
-    MAIN_MENU,
-    SURVEY_NAME,
-    SURVEY_EMAIL,
-    SURVEY_PHONE,
-    MAIN_PROGRAM_NOW,
-    CURRENT_LEVEL,
-    CURRENT_TRAINER,
-    STUDIED_BEFORE,
-    STUDIED_LEVELS,
-    DESIRED_TRAINER,
-    PLAN_STUDY,
-    PLANNED_LEVEL,
-    PLANNED_TRAINER,
-    SPECIALIZATIONS_NOW,
-    SPEC_LIST_NOW,
-    SPEC_TRAINER_NOW,
-    SPECIALIZATIONS_BEFORE,
-    SPEC_LIST_BEFORE,
-    SPEC_TRAINER_BEFORE,
-    EVENTS,
-    EVENTS_OTHER,
-    FEEDBACK,
-    REVIEW_COURSE,
-    REVIEW_TRAINER,
-    REVIEW_RATING,
-    REVIEW_RESULTS,
-    PRIVACY_POLICY,
-    NOTIFICATION_CONSENT,
-    REVIEW_PUBLICATION_CONSENT,
-) = range(29) 
-
-# Текстовые блоки для сообщений
-BLOCKS = {
-    "spec_trainer_now": "13. Кто Ваш тренер?",
-    "events": "🔹 Блок 4. Дополнительные мероприятия\n\n15. В каких дополнительных мероприятиях центра Вы участвовали?",
-    "spec_list_before": "16. Выберите специализацию(и), которые Вы проходили:\n(Выберите одну или несколько специализаций, затем 'Завершить выбор')",
-    "spec_trainer_before": "17. Кто был Ваш тренер?",
-    "events_other": "Укажите, пожалуйста, в каких мероприятиях Вы участвовали:",
-    "feedback": "🔹 Блок 5. Пожелания\n\n18. Что больше всего Вам понравилось? Что можно улучшить?",
-    "next_event": "Выберите следующее мероприятие или нажмите 'Не участвовал'"
-}
-
-RESPONSES = {
-    "survey_success": "✅ Спасибо, что прошли опрос! До встречи на занятиях!",
-    "survey_error": "Спасибо за опрос! Возникли временные трудности с сохранением результатов. Администратор уже уведомлен.",
-    "cancel": "Действие отменено. Выберите пункт меню:",  # <- Здесь была пропущена запятая!
-    "privacy_policy_required": "Для продолжения необходимо подтвердить согласие с Политикой конфиденциальности.",
-    "notification_consent_info": "Вы можете в любое время отозвать согласие на уведомления, обратившись в наш центр.",
-}
-
 # Хранение данных пользователя
-user_data = {}
-
-# Клавиатуры
-main_menu_keyboard = ReplyKeyboardMarkup(
-    [
-        ["Пройти опрос"],
-        ["Ближайшие мероприятия", "Контакты"],
-        ["Оплата услуг центра"],
-        ["Основная программа обучения в Центре"],
-        ["Дополнительные курсы и программы Центра"],
-        ["Оставить отзыв"],
-    ],
-    resize_keyboard=True,
-    one_time_keyboard=True
-)
+sessions = SessionStore(max_size=SESSION_MAX_SIZE, ttl=SESSION_TTL)
 
-yes_no_keyboard = ReplyKeyboardMarkup(
-    [["Да", "Нет"]],
-    resize_keyboard=True,
-    one_time_keyboard=True
-)
+# Фоновая запись результатов
+writer = SubmissionWriter(batch_size=WRITER_BATCH_SIZE, batch_timeout_ms=WRITER_BATCH_MS)
 
-levels_keyboard = ReplyKeyboardMarkup(
-    [["1 ступень"], ["2 ступень"], ["3 ступень"], ["Завершить выбор"]],
-    resize_keyboard=True,
-    one_time_keyboard=True
+# Все исходящие запросы бота проходят через общую очередь с приоритетами
+scheduler = SendScheduler(
+    rate=SEND_RATE, burst=int(SEND_RATE), chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST
 )
 
-spec_keyboard = ReplyKeyboardMarkup(
-    [
-        ["Гештальт-подход в терапии психосоматических расстройств"],
-        ["Семейная гештальт-терапия"],
-        ["Гештальт-подход в сексологии"],
-        ["Гештальт-терапия травматического опыта"],
-        ["Арт-гештальт: творческая терапия"],
-        ["Гештальт-терапия в работе с детьми и подростками"],
-        ["Групповая гештальт-терапия"],
-        ["Гештальт-терапия в клинической практике"],
-        ["Завершить выбор"]
-    ],
-    resize_keyboard=True,
-    one_time_keyboard=True
-)
+# Статистика отзывов по тренерам и курсам
+review_stats = ReviewStats()
+
+# Выгрузки по команде /export выполняются по одной
+export_lock = asyncio.Lock()
+
+# Рассылки пользователям, согласным на уведомления
+broadcaster = Broadcaster(BroadcastStore(), concurrency=BROADCAST_CONCURRENCY)
+
+def api_request(pool, size):
+    """Клиент Bot API с отдельным пулом соединений"""
+    return metrics.TimedRequest(
+        pool=pool,
+        connection_pool_size=size,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        read_timeout=API_READ_TIMEOUT,
+        write_timeout=API_WRITE_TIMEOUT,
+        pool_timeout=API_POOL_TIMEOUT,
+        http_version=API_HTTP_VERSION,
+    )
 
-events_keyboard = ReplyKeyboardMarkup(
-    [
-        ["Летняя интенсивная программа"],
-        ["Онлайн конференция"],
-        ["День открытых дверей"],
-        ["Другое"],
-        ["Не участвовал"]
-    ],
-    resize_keyboard=True,
-    one_time_keyboard=True
+# Рассылки идут через своего клиента бота, чтобы не занимать соединения ответов пользователям
+bulk_bot = ExtBot(
+    TOKEN,
+    base_url=f"{TELEGRAM_API_URL}/bot" if TELEGRAM_API_URL else "https://api.telegram.org/bot",
+    request=api_request("bulk", API_BULK_POOL_SIZE),
+    rate_limiter=scheduler,
 )
 
-rating_keyboard = ReplyKeyboardMarkup(
-    [[str(i) for i in range(1, 6)], [str(i) for i in range(6, 11)]],
-    resize_keyboard=True,
-    one_time_keyboard=True
-)
+def expects_webhook_reply(update: Update) -> bool:
+    """Ответ в теле вебхука бывает только на кнопки главного меню (main_menu)"""
+    message = update.message
+    return message is not None and message.text in content.current.menu_replies
+
+# Ответы меню в теле ответа на вебхук (без отдельного запроса к Bot API)
+webhook_replies = WebhookReplies(expects_webhook_reply, scheduler)
+
+# Профилирование по команде /profile или сигналу SIGUSR1
+profiler = profiling.Profiler()
+
+# Тексты, клавиатуры и сценарии; обработчики берут готовый снимок content.current
+content = ContentStore(CONTENT_PATH)
 
 def sanitize_filename(name):
     """Очистка имени файла от недопустимых символов"""
     return re.sub(r'[\\/*?:"<>|]', "", name).strip()
 
-def save_to_excel(data, filename="data/SurveyResults.xlsx"):
-    """Сохранение результатов в Excel с улучшенной обработкой"""
-    try:
-        # Подготовка данных для сохранения
-        prepared_data = {}
-        
-        # Копируем все поля из data
-        for key, value in data.items():
-            if isinstance(value, list):
-                prepared_data[key] = ", ".join(value)
-            else:
-                prepared_data[key] = value
-        
-        # Добавляем дату заполнения
-        prepared_data["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        df = pd.DataFrame([prepared_data])
-        
-        # Проверяем существование файла
-        if os.path.exists(filename):
-            try:
-                existing_df = pd.read_excel(filename)
-                updated_df = pd.concat([existing_df, df], ignore_index=True)
-            except Exception as e:
-                logger.error(f"Error reading existing Excel file: {e}")
-                # Если не удалось прочитать существующий файл, создаем новый
-                updated_df = df
-        else:
-            updated_df = df
-        
-        # Сохраняем файл
-        updated_df.to_excel(filename, index=False)
-        logger.info(f"Data successfully saved to {filename}")
-        return True
-    except Exception as e:
-        logger.error(f"Error saving to Excel: {e}")
-        return False
-
-async def start(update: Update, context: CallbackContext) -> int:
-    """Начало разговора и главное меню"""
-    user = update.message.from_user
-    user_data[user.id] = {
-        "telegram_id": user.id, 
-        "username": user.username,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    
-    await update.message.reply_text(
-        "Добро пожаловать в Центр практической психологии 'Феномены'! "
-        "Выберите нужный пункт меню:",
-        reply_markup=main_menu_keyboard
+async def report_save_result(bot, submission) -> None:
+    """Учет сохраненного отзыва в статистике; уведомление пользователя, если сохранение не удалось"""
+    if submission.status == "saved":
+        if submission.kind == "review":
+            review_stats.add(submission.data)
+        return
+    logger.error(f"Failed to save {submission.kind} for chat {submission.chat_id}: {submission.error}")
+    if submission.chat_id is None:
+        return
+    texts = content.current
+    await bot.send_message(
+        submission.chat_id, texts.responses[f"{submission.kind}_error"], reply_markup=texts.main_menu
     )
-    return MAIN_MENU
 
-async def main_menu(update: Update, context: CallbackContext) -> int:
-    """Обработка выбора в главном меню"""
-    user = update.message.from_user
-    choice = update.message.text
-    
-    if choice == "Пройти опрос":
-        await update.message.reply_text(
-            "🔹 Блок 1. Общие данные\n\n1. Как Вас зовут?\n"
-            "(Введите имя и фамилию)",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return SURVEY_NAME
-    
-    elif choice == "Ближайшие мероприятия":
-        await update.message.reply_text(
-            "Ближайшие мероприятия центра:\nhttps://phenomeny.by/intensiv_2025",
-            reply_markup=main_menu_keyboard
-        )
-        return MAIN_MENU
-    
-    elif choice == "Контакты":
-        await update.message.reply_text(
-            "ООО 'Центр практической психологии 'Феномены'\n"
-            "Юридический адрес: 220114, г. Минск, ул. Макаенка, 12е, пом. 298.\n"
-            "Телефон: +375291292429",
-            reply_markup=main_menu_keyboard
+async def post_init(application: Application) -> None:
+    """Запуск фоновых задач после инициализации бота"""
+    await asyncio.to_thread(review_stats.load)
+    writer.on_result = lambda submission: report_save_result(application.bot, submission)
+    await writer.start()
+    # Прерванная остановкой рассылка продолжается
+    broadcaster.on_finish = report_broadcast
+    await bulk_bot.initialize()
+    if WORKER_ID == 0:
+        broadcaster.resume(bulk_bot)
+    if METRICS_PORT:
+        metrics.start_server(METRICS_PORT, METRICS_ADDR)
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiling)
+
+async def post_stop(application: Application) -> None:
+    """Дописываем очередь сохранений, статусы рассылки и статистику перед остановкой"""
+    await broadcaster.stop()
+    await sweep_abandoned()
+    await writer.stop()
+    if review_stats.changed:
+        await asyncio.to_thread(review_stats.save)
+    await bulk_bot.shutdown()
+
+def toggle_profiling() -> None:
+    """SIGUSR1: первый сигнал запускает сэмплирование стеков, второй - записывает результат"""
+    if not profiler.stop():
+        profiler.start("sample")
+
+async def profile(update: Update, context: CallbackContext) -> None:
+    """Профилирование на заданное время (только для администраторов)"""
+    args = context.args
+    # Время и режим можно указать в любом порядке
+    numbers = [int(arg) for arg in args if arg.isdigit()]
+    modes = [arg for arg in args if arg in profiling.MODES]
+    seconds = numbers[0] if numbers else 30
+    mode = modes[0] if modes else "cprofile"
+    parsed = len(numbers) <= 1 and len(modes) <= 1 and len(numbers) + len(modes) == len(args)
+    if not parsed or not 0 < seconds <= PROFILE_MAX_SECONDS:
+        await update.message.reply_text(ADMIN_RESPONSES["profile_usage"])
+        return
+    if not profiler.start(mode):
+        await update.message.reply_text(ADMIN_RESPONSES["profile_running"])
+        return
+    context.job_queue.run_once(finish_profile, seconds, chat_id=update.effective_chat.id)
+    await update.message.reply_text(ADMIN_RESPONSES["profile_started"].format(mode=mode, seconds=seconds))
+
+async def finish_profile(context: CallbackContext) -> None:
+    """Запись профиля по окончании окна профилирования"""
+    mode = profiler.mode
+    path = profiler.stop()
+    if path is None:
+        # Профилирование уже остановили сигналом
+        return
+    text = ADMIN_RESPONSES["profile_saved"].format(path=path)
+    if mode == "cprofile":
+        text += "\n\n" + profiling.summary(path)[:3500]
+    await context.bot.send_message(context.job.chat_id, text)
+
+async def report_broadcast(bot, broadcast_id, chat_id, counts) -> None:
+    """Отчет администратору о завершенной рассылке"""
+    if chat_id is not None:
+        await bot.send_message(
+            chat_id, ADMIN_RESPONSES["broadcast_status"].format(id=broadcast_id, state="", **counts)
         )
-        return MAIN_MENU
-    
-    elif choice == "Оплата услуг центра":
-        await update.message.reply_text(
-            "Оплата услуг центра:\nhttps://phenomeny.by/payment",
-            reply_markup=main_menu_keyboard
-        )
-        return MAIN_MENU
-    
-    elif choice == "Основная программа обучения в Центре":
-        await update.message.reply_text(
-            "Основная программа обучения:\nhttps://phenomeny.by/education",
-            reply_markup=main_menu_keyboard
-        )
-        return MAIN_MENU
-    
-    elif choice == "Дополнительные курсы и программы Центра":
-        await update.message.reply_text(
-            "Дополнительные курсы и программы:\nhttps://phenomeny.by/specializations",
-            reply_markup=main_menu_keyboard
-        )
-        return MAIN_MENU
-    
-    elif choice == "Оставить отзыв":
-        await update.message.reply_text(
-            "Спасибо за желание оставить отзыв!\n\n"
-            "1. Какой курс вы проходили и почему выбрали именно его?",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return REVIEW_COURSE
-    
-    else:
-        await update.message.reply_text(
-            "Пожалуйста, выберите один из вариантов меню.",
-            reply_markup=main_menu_keyboard
-        )
-        return MAIN_MENU
-
-async def survey_name(update: Update, context: CallbackContext) -> int:
-    """Получение имени пользователя"""
-    user = update.message.from_user
-    user_data[user.id]["name"] = update.message.text
-    
-    await update.message.reply_text(
-        "2. Укажите, пожалуйста Ваш email:",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return SURVEY_EMAIL
 
-async def survey_email(update: Update, context: CallbackContext) -> int:
-    """Получение email пользователя"""
-    user = update.message.from_user
-    user_data[user.id]["email"] = update.message.text
-    
+async def broadcast(update: Update, context: CallbackContext) -> None:
+    """Рассылка сообщения всем, кто согласился на уведомления (только для администраторов)"""
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text(ADMIN_RESPONSES["broadcast_usage"])
+        return
+    if broadcaster.active:
+        await update.message.reply_text(ADMIN_RESPONSES["broadcast_running"])
+        return
+    recipients = await asyncio.to_thread(storage.notification_recipients)
+    if not recipients:
+        await update.message.reply_text(ADMIN_RESPONSES["broadcast_empty"])
+        return
+    broadcast_id = await broadcaster.start(bulk_bot, parts[1], update.effective_chat.id, recipients)
+    if broadcast_id is None:
+        await update.message.reply_text(ADMIN_RESPONSES["broadcast_running"])
+        return
     await update.message.reply_text(
-        "3. Укажите, пожалуйста ваш номер телефона:",
-        reply_markup=ReplyKeyboardRemove()
+        ADMIN_RESPONSES["broadcast_started"].format(id=broadcast_id, count=len(recipients))
     )
-    return SURVEY_PHONE
 
-async def survey_phone(update: Update, context: CallbackContext) -> int:
-    """Получение телефона пользователя"""
-    user = update.message.from_user
-    user_data[user.id]["phone"] = update.message.text
-    
+async def broadcast_status(update: Update, context: CallbackContext) -> None:
+    """Состояние текущей или последней рассылки"""
+    broadcast_id, counts = await broadcaster.counts()
+    if broadcast_id is None:
+        await update.message.reply_text(ADMIN_RESPONSES["broadcast_none"])
+        return
+    state = " (идет)" if broadcaster.active else ""
     await update.message.reply_text(
-        "🔹 Блок 2. Обучение по основной программе\n\n"
-        "4. Вы сейчас обучаетесь у нас по основной программе (1–3 ступень)?",
-        reply_markup=yes_no_keyboard
+        ADMIN_RESPONSES["broadcast_status"].format(id=broadcast_id, state=state, **counts)
     )
-    return MAIN_PROGRAM_NOW
 
-async def main_program_now(update: Update, context: CallbackContext) -> int:
-    """Обучается ли пользователь по основной программе"""
-    user = update.message.from_user
-    answer = update.message.text.lower()
-    user_data[user.id]["main_program_now"] = answer
-    
-    if answer == "да":
-        await update.message.reply_text(
-            "5. На какой ступени Вы обучаетесь?\n"
-            "(Выберите одну или несколько ступеней, затем 'Завершить выбор')",
-            reply_markup=levels_keyboard
+async def show_stats(update: Update, context: CallbackContext) -> None:
+    """Статистика отзывов: общий список или тренер/курс по названию"""
+    if SESSION_BACKEND != "local":
+        # Отзывы могли сохранить другие процессы бота
+        await asyncio.to_thread(review_stats.refresh)
+    if not review_stats.reviews:
+        await update.message.reply_text(ADMIN_RESPONSES["stats_empty"])
+        return
+    if context.args:
+        name = " ".join(context.args)
+        aggregate = review_stats.get("trainer", name) or review_stats.get("course", name)
+        if aggregate is None:
+            await update.message.reply_text(ADMIN_RESPONSES["stats_not_found"].format(name=name))
+            return
+        histogram = " ".join(
+            f"{rating}:{count}" for rating, count in enumerate(aggregate.histogram, 1) if count
         )
-        return CURRENT_LEVEL
+        lines = [ADMIN_RESPONSES["stats_detail"].format(
+            name=aggregate.name, mean=aggregate.mean, count=aggregate.count, histogram=histogram
+        )]
+        if aggregate.comments:
+            lines.append(ADMIN_RESPONSES["stats_comments"])
+            lines.extend(f"— {comment}" for comment in reversed(aggregate.comments))
     else:
-        await update.message.reply_text(
-            "6. Ранее Вы обучались в нашем центре по основной программе?",
-            reply_markup=yes_no_keyboard
-        )
-        return STUDIED_BEFORE
-
-async def current_level(update: Update, context: CallbackContext) -> int:
-    """Текущая ступень обучения"""
-    user = update.message.from_user
-    text = update.message.text
-    
-    if "current_level" not in user_data[user.id]:
-        user_data[user.id]["current_level"] = []
-    
-    if text == "Завершить выбор":
-        if not user_data[user.id]["current_level"]:
-            await update.message.reply_text(
-                "Пожалуйста, выберите хотя бы одну ступень.",
-                reply_markup=levels_keyboard
+        lines = [ADMIN_RESPONSES["stats_header"].format(reviews=review_stats.reviews)]
+        for group, header in (("trainer", "stats_trainers"), ("course", "stats_courses")):
+            lines.append("")
+            lines.append(ADMIN_RESPONSES[header])
+            lines.extend(
+                ADMIN_RESPONSES["stats_line"].format(name=a.name, mean=a.mean, count=a.count)
+                for a in review_stats.top(group)[:20]
             )
-            return CURRENT_LEVEL
-        
-        await update.message.reply_text(
-            "6. Кто Ваш тренер?",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return CURRENT_TRAINER
-    else:
-        if text not in user_data[user.id]["current_level"]:
-            user_data[user.id]["current_level"].append(text)
-        
-        await update.message.reply_text(
-            "Выберите следующую ступень или нажмите 'Завершить выбор'",
-            reply_markup=levels_keyboard
-        )
-        return CURRENT_LEVEL
-
-async def current_trainer(update: Update, context: CallbackContext) -> int:
-    """Текущий тренер"""
-    user = update.message.from_user
-    user_data[user.id]["current_trainer"] = update.message.text
-    
-    await update.message.reply_text(
-        "🔹 Блок 3. Обучение по специализациям\n\n"
-        "11. Вы обучаетесь в нашем центре по специализациям?",
-        reply_markup=yes_no_keyboard
-    )
-    return SPECIALIZATIONS_NOW
-
-async def studied_before(update: Update, context: CallbackContext) -> int:
-    """Обучался ли ранее"""
-    user = update.message.from_user
-    answer = update.message.text.lower()
-    user_data[user.id]["studied_before"] = answer
-    
-    if answer == "да":
-        await update.message.reply_text(
-            "На какой ступени Вы обучались?\n"
-            "(Выберите одну или несколько ступеней, затем 'Завершить выбор')",
-            reply_markup=levels_keyboard
-        )
-        return STUDIED_LEVELS
-    else:
-        await update.message.reply_text(
-            "8. Планируете ли начать обучение по основной программе?",
-            reply_markup=yes_no_keyboard
-        )
-        return PLAN_STUDY
+    await update.message.reply_text("\n".join(lines)[:4096])
 
-async def studied_levels(update: Update, context: CallbackContext) -> int:
-    """Пройденные ступени обучения"""
-    user = update.message.from_user
-    text = update.message.text
-    
-    if "studied_levels" not in user_data[user.id]:
-        user_data[user.id]["studied_levels"] = []
-    
-    if text == "Завершить выбор":
-        if not user_data[user.id]["studied_levels"]:
-            await update.message.reply_text(
-                "Пожалуйста, выберите хотя бы одну ступень.",
-                reply_markup=levels_keyboard
+async def export_data(update: Update, context: CallbackContext) -> None:
+    """Выгрузка записей за период файлом (только для администраторов)"""
+    args = list(context.args)
+    fmt = args.pop() if args and args[-1] in export.FORMATS else "xlsx"
+    today = datetime.now()
+    try:
+        kind = args[0]
+        if kind not in storage.FIELDS or len(args) > 3:
+            raise ValueError(kind)
+        start = datetime.strptime(args[1], export.DATE_FORMAT) if len(args) > 1 else today.replace(day=1)
+        end = datetime.strptime(args[2], export.DATE_FORMAT) if len(args) > 2 else today
+    except (IndexError, ValueError):
+        await update.message.reply_text(ADMIN_RESPONSES["export_usage"])
+        return
+    if export_lock.locked():
+        await update.message.reply_text(ADMIN_RESPONSES["export_running"])
+        return
+    period = {"kind": kind, "start": f"{start:%Y-%m-%d}", "end": f"{end:%Y-%m-%d}"}
+    # Выгрузка идет в фоне, обработка обновлений не ждет ее
+    context.application.create_task(send_export(context.bot, update.effective_chat.id, fmt, period))
+    await update.message.reply_text(ADMIN_RESPONSES["export_started"].format(**period))
+
+async def send_export(bot, chat_id, fmt, period) -> None:
+    """Выгрузка в отдельном процессе и отправка файла документом"""
+    async with export_lock:
+        directory = os.path.join("data", "exports")
+        os.makedirs(directory, exist_ok=True)
+        suffix = "xlsx" if fmt == "xlsx" else "csv.gz"
+        path = os.path.join(directory, f"{period['kind']}_{period['start']}_{period['end']}.{suffix}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(export.__file__),
+                period["kind"], period["start"], period["end"], fmt, path,
+                stdout=asyncio.subprocess.PIPE,
             )
-            return STUDIED_LEVELS
-        
-        await update.message.reply_text(
-            "7. К какому тренеру Вы хотели бы попасть?",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return DESIRED_TRAINER
-    else:
-        if text not in user_data[user.id]["studied_levels"]:
-            user_data[user.id]["studied_levels"].append(text)
-        
-        await update.message.reply_text(
-            "Выберите следующую ступень или нажмите 'Завершить выбор'",
-            reply_markup=levels_keyboard
+            output, _ = await process.communicate()
+            if process.returncode != 0:
+                logger.error(f"Export exited with code {process.returncode}")
+                await bot.send_message(chat_id, ADMIN_RESPONSES["export_failed"])
+                return
+            size = os.path.getsize(path)
+            if size > DOCUMENT_MAX_BYTES:
+                await bot.send_message(
+                    chat_id, ADMIN_RESPONSES["export_too_large"].format(size=size // (1024 * 1024))
+                )
+                return
+            caption = ADMIN_RESPONSES["export_done"].format(count=int(output.split()[-1]), **period)
+            with open(path, "rb") as document:
+                await bot.send_document(
+                    chat_id, document, filename=os.path.basename(path), caption=caption, write_timeout=120
+                )
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+async def checkpoint_job(context: CallbackContext) -> None:
+    """Запись изменившихся сессий и статистики отзывов на диск"""
+    if context.application.persistence:
+        await context.application.persistence.checkpoint()
+    if review_stats.changed:
+        await asyncio.to_thread(review_stats.save)
+
+async def sweep_abandoned() -> None:
+    """Запись брошенных сценариев одной пачкой в хранилище незавершенных"""
+    abandoned = sessions.take_abandoned()
+    if not abandoned:
+        return
+    records = [engine.partial_record(flow, session, state) for session, flow, state in abandoned]
+    if not await writer.save_batch("incomplete", records):
+        # Ответы остаются в памяти до следующей попытки
+        sessions.return_abandoned(abandoned)
+        logger.error(f"Failed to save {len(records)} abandoned sessions, will retry")
+        return
+    by_state = {}
+    for record in records:
+        by_state[record["state"]] = by_state.get(record["state"], 0) + 1
+    for state, count in by_state.items():
+        metrics.ABANDONED_SESSIONS.labels(state).inc(count)
+    summary = ", ".join(f"{state}: {count}" for state, count in sorted(by_state.items()))
+    logger.info(f"Swept {len(records)} abandoned sessions ({summary})")
+
+async def sweep_job(context: CallbackContext) -> None:
+    """Периодическая запись брошенных сценариев"""
+    persistence = context.application.persistence
+    if persistence and CONVERSATION_TIMEOUT:
+        await engine.expire_restored(context.application, persistence.restored, CONVERSATION_TIMEOUT)
+    await sweep_abandoned()
+
+async def shared_cleanup_job(context: CallbackContext) -> None:
+    """Удаление истекших состояний пользователей из общей базы"""
+    removed = await asyncio.to_thread(context.application.shared.backend.cleanup)
+    if removed:
+        logger.info(f"Removed {removed} expired shared states")
+
+async def reload_content(update: Update, context: CallbackContext) -> None:
+    """Перезагрузка текстов, меню и сценариев без перезапуска (только для администраторов)"""
+    try:
+        await content.reload()
+    except Exception as e:
+        logger.error(f"Error reloading content: {e}")
+        await update.message.reply_text(ADMIN_RESPONSES["reload_failed"].format(error=e))
+        return
+    await update.message.reply_text(ADMIN_RESPONSES["reload_done"])
+
+async def content_watch_job(context: CallbackContext) -> None:
+    """Перезагрузка текстов при изменении файла (в каждом процессе бота)"""
+    if not content.changed():
+        return
+    try:
+        await content.reload()
+    except Exception as e:
+        logger.error(f"Error reloading content: {e}")
+
+async def export_job(context: CallbackContext) -> None:
+    """Периодическая выгрузка результатов в Excel"""
+    months = storage.take_dirty()
+    if not months:
+        return
+    # pandas и openpyxl загружаются только в процессе выгрузки, а не в боте
+    args = [f"{kind}:{month}" for kind, month in sorted(months)]
+    with metrics.EXPORT_SECONDS.time():
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(storage.__file__), *args
         )
-        return STUDIED_LEVELS
+        await process.wait()
+    if process.returncode != 0:
+        logger.error(f"Excel export exited with code {process.returncode}")
+        storage.mark_dirty(months)
 
-async def desired_trainer(update: Update, context: CallbackContext) -> int:
-    """Желаемый тренер"""
-    user = update.message.from_user
-    user_data[user.id]["desired_trainer"] = update.message.text
+async def start(update: Update, context: CallbackContext) -> None:
+    """Начало разговора и главное меню"""
+    # Прежние ответы сбрасываются; новая сессия создается при входе в опрос или отзыв
+    sessions.pop(update.message.from_user.id)
     
-    await update.message.reply_text(
-        "🔹 Блок 3. Обучение по специализациям\n\n"
-        "11. Вы обучаетесь в нашем центре по специализациям?",
-        reply_markup=yes_no_keyboard
-    )
-    return SPECIALIZATIONS_NOW
+    texts = content.current
+    await update.message.reply_text(texts.welcome, reply_markup=texts.main_menu)
 
-async def plan_study(update: Update, context: CallbackContext) -> int:
-    """Планирует ли обучение"""
-    user = update.message.from_user
-    answer = update.message.text.lower()
-    user_data[user.id]["plan_study"] = answer
-    
-    if answer == "да":
-        await update.message.reply_text(
-            "9. Какую ступень планируете начать?",
-            reply_markup=levels_keyboard
-        )
-        return PLANNED_LEVEL
+async def main_menu(update: Update, context: CallbackContext) -> None:
+    """Обработка выбора в главном меню"""
+    texts = content.current
+    text = texts.menu_replies.get(update.message.text, texts.responses["invalid_choice"])
+    await webhook_replies.reply(update, text, reply_markup=texts.main_menu)
+
+async def finish(flow, update: Update, session) -> None:
+    """Завершение сценария: сохранение в фоне и ответ пользователю"""
+    chat_id = update.effective_chat.id
+    if flow.record == "review":
+        writer.submit("review", session.review_record().to_record(), chat_id=chat_id)
     else:
-        await update.message.reply_text(
-            "🔹 Блок 3. Обучение по специализациям\n\n"
-            "11. Вы обучаетесь в нашем центре по специализациям?",
-            reply_markup=yes_no_keyboard
-        )
-        return SPECIALIZATIONS_NOW
-
-async def planned_level(update: Update, context: CallbackContext) -> int:
-    """Планируемая ступень"""
-    user = update.message.from_user
-    user_data[user.id]["planned_level"] = update.message.text
-    
-    await update.message.reply_text(
-        "10. К какому тренеру Вы хотели бы попасть?",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return PLANNED_TRAINER
-
-async def planned_trainer(update: Update, context: CallbackContext) -> int:
-    """Желаемый тренер для планируемого обучения"""
-    user = update.message.from_user
-    user_data[user.id]["planned_trainer"] = update.message.text
-    
-    await update.message.reply_text(
-        "🔹 Блок 3. Обучение по специализациям\n\n"
-        "11. Вы обучаетесь в нашем центре по специализациям?",
-        reply_markup=yes_no_keyboard
+        writer.submit("survey", session.to_record(), chat_id=chat_id)
+    # Ответы сохранены - сессия больше не нужна
+    sessions.pop(session.telegram_id)
+    # Ответ кнопкой приходит без сообщения пользователя - отвечаем в чат вопроса
+    texts = content.current
+    await update.effective_message.reply_text(
+        texts.responses[f"{flow.record}_success"], reply_markup=texts.main_menu
     )
-    return SPECIALIZATIONS_NOW
-
-async def specializations_now(update: Update, context: CallbackContext) -> int:
-    """Обучается ли по специализациям сейчас"""
-    user = update.message.from_user
-    answer = update.message.text.lower()
-    user_data[user.id]["specializations_now"] = answer
-    
-    if answer == "да":
-        await update.message.reply_text(
-            "12. Выберите специализацию(и):\n"
-            "(Выберите одну или несколько специализаций, затем 'Завершить выбор')",
-            reply_markup=spec_keyboard
-        )
-        return SPEC_LIST_NOW
-    else:
-        await update.message.reply_text(
-            "14. Проходили ли Вы ранее обучение по специализациям в нашем центре?",
-            reply_markup=yes_no_keyboard
-        )
-        return SPECIALIZATIONS_BEFORE
-
-async def spec_list_now(update: Update, context: CallbackContext) -> int:
-    """Список текущих специализаций"""
-    user = update.message.from_user
-    text = update.message.text
-    
-    if "spec_list_now" not in user_data[user.id]:
-        user_data[user.id]["spec_list_now"] = []
-    
-    if text == "Завершить выбор":
-        if not user_data[user.id]["spec_list_now"]:
-            await update.message.reply_text(
-                "Пожалуйста, выберите хотя бы одну специализацию.",
-                reply_markup=spec_keyboard
-            )
-            return SPEC_LIST_NOW
-        
-        await update.message.reply_text(BLOCKS["spec_trainer_now"], reply_markup=ReplyKeyboardRemove())
-        return SPEC_TRAINER_NOW
-    else:
-        if text not in user_data[user.id]["spec_list_now"]:
-            user_data[user.id]["spec_list_now"].append(text)
-        
-        await update.message.reply_text("Выберите следующую специализацию или нажмите 'Завершить выбор'",
-                                      reply_markup=spec_keyboard)
-        return SPEC_LIST_NOW
-
-async def spec_trainer_now(update: Update, context: CallbackContext) -> int:
-    """Тренер по специализации"""
-    user = update.message.from_user
-    user_data[user.id]["spec_trainer_now"] = update.message.text
-    await update.message.reply_text(BLOCKS["events"], reply_markup=events_keyboard)
-    return EVENTS
-
-async def specializations_before(update: Update, context: CallbackContext) -> int:
-    """Обучался ли по специализациям ранее"""
-    user = update.message.from_user
-    answer = update.message.text.lower()
-    user_data[user.id]["specializations_before"] = answer
-    
-    if answer == "да":
-        await update.message.reply_text(BLOCKS["spec_list_before"], reply_markup=spec_keyboard)
-        return SPEC_LIST_BEFORE
-    else:
-        await update.message.reply_text(BLOCKS["events"], reply_markup=events_keyboard)
-        return EVENTS
-
-async def spec_list_before(update: Update, context: CallbackContext) -> int:
-    """Список пройденных специализаций"""
-    user = update.message.from_user
-    text = update.message.text
-    
-    if "spec_list_before" not in user_data[user.id]:
-        user_data[user.id]["spec_list_before"] = []
-    
-    if text == "Завершить выбор":
-        if not user_data[user.id]["spec_list_before"]:
-            await update.message.reply_text("Пожалуйста, выберите хотя бы одну специализацию.",
-                                          reply_markup=spec_keyboard)
-            return SPEC_LIST_BEFORE
-        
-        await update.message.reply_text(BLOCKS["spec_trainer_before"], reply_markup=ReplyKeyboardRemove())
-        return SPEC_TRAINER_BEFORE
-    else:
-        if text not in user_data[user.id]["spec_list_before"]:
-            user_data[user.id]["spec_list_before"].append(text)
-        
-        await update.message.reply_text("Выберите следующую специализацию или нажмите 'Завершить выбор'",
-                                      reply_markup=spec_keyboard)
-        return SPEC_LIST_BEFORE
-
-async def spec_trainer_before(update: Update, context: CallbackContext) -> int:
-    """Тренер по специализации ранее"""
-    user = update.message.from_user
-    user_data[user.id]["spec_trainer_before"] = update.message.text
-    await update.message.reply_text(BLOCKS["events"], reply_markup=events_keyboard)
-    return EVENTS
-
-async def events(update: Update, context: CallbackContext) -> int:
-    """Участие в мероприятиях"""
-    user = update.message.from_user
-    text = update.message.text
-    
-    if "events" not in user_data[user.id]:
-        user_data[user.id]["events"] = []
-    
-    if text == "Другое":
-        await update.message.reply_text(BLOCKS["events_other"], reply_markup=ReplyKeyboardRemove())
-        return EVENTS_OTHER
-    elif text == "Не участвовал":
-        user_data[user.id]["events"] = ["Не участвовал"]
-        await update.message.reply_text(BLOCKS["feedback"], reply_markup=ReplyKeyboardRemove())
-        return FEEDBACK
-    else:
-        user_data[user.id]["events"].append(text)
-        await update.message.reply_text(BLOCKS["next_event"], reply_markup=events_keyboard)
-        return EVENTS
 
-async def events_other(update: Update, context: CallbackContext) -> int:
-    """Другие мероприятия"""
-    user = update.message.from_user
-    user_data[user.id]["events"].append(f"Другое: {update.message.text}")
-    await update.message.reply_text(BLOCKS["feedback"], reply_markup=ReplyKeyboardRemove())
-    return FEEDBACK
+# Опрос и отзыв: сценарии из снимка текстов
+engine = SurveyEngine(content, sessions, on_finish=finish)
 
-async def feedback(update: Update, context: CallbackContext) -> int:
-    """Обратная связь"""
-    user = update.message.from_user
-    user_data[user.id]["feedback"] = update.message.text
-    
-    # Добавляем клавиатуру для согласия с политикой конфиденциальности
-    privacy_keyboard = ReplyKeyboardMarkup(
-        [["✅ Подтверждаю", "❌ Не подтверждаю"]],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-    
-    await update.message.reply_text(
-        "Пожалуйста, подтвердите:\n\n"
-        "Я подтверждаю, что ознакомлен(а) с Политикой конфиденциальности сайта, "
-        "даю согласие на сбор и обработку моих персональных данных в соответствии с "
-        "Законом Республики Беларусь от 7 мая 2021 года № 99-З «О защите персональных данных».\n"
-        "Подробнее: https://phenomeny.by/privacy_policy",
-        reply_markup=privacy_keyboard
-    )
-    return PRIVACY_POLICY
+async def expired_button(update: Update, context: CallbackContext) -> None:
+    """Нажатие кнопки под вопросом, на который уже ответили"""
+    await update.callback_query.answer(content.current.responses["button_expired"])
 
-async def privacy_policy(update: Update, context: CallbackContext) -> int:
-    """Обработка согласия с политикой конфиденциальности"""
+async def cancel(update: Update, context: CallbackContext) -> int:
+    """Отмена текущего действия"""
     user = update.message.from_user
-    choice = update.message.text
-    
-    if choice == "✅ Подтверждаю":
-        user_data[user.id]["privacy_policy_consent"] = True
-    else:
-        user_data[user.id]["privacy_policy_consent"] = False
-    
-    # Добавляем клавиатуру для согласия на уведомления
-    notification_keyboard = ReplyKeyboardMarkup(
-        [["✅ Согласен(-на)", "❌ Не согласен(-на)"]],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
+    logger.info(f"User {user.id} canceled the conversation.")
     
+    texts = content.current
     await update.message.reply_text(
-        "Я согласен(-на) на получение уведомлений по электронной почте и SMS, "
-        "связанных с участием в обучающих курсах.",
-        reply_markup=notification_keyboard
+        texts.responses["cancel"],
+        reply_markup=texts.main_menu
     )
-    return NOTIFICATION_CONSENT
-
-async def notification_consent(update: Update, context: CallbackContext) -> int:
-    """Обработка согласия на уведомления"""
-    user = update.message.from_user
-    choice = update.message.text
-    
-    if choice == "✅ Согласен(-на)":
-        user_data[user.id]["notification_consent"] = True
-    else:
-        user_data[user.id]["notification_consent"] = False
-    
-    # Сохраняем данные
-    filename = f"data/SurveyResults_{datetime.now().strftime('%Y%m')}.xlsx"
-    if save_to_excel(user_data[user.id], filename):
-        await update.message.reply_text(RESPONSES["survey_success"], reply_markup=main_menu_keyboard)
-    else:
-        await update.message.reply_text(RESPONSES["survey_error"], reply_markup=main_menu_keyboard)
-    
-    return MAIN_MENU
-
-async def review_course(update: Update, context: CallbackContext) -> int:
-    """Какой курс проходил пользователь"""
-    user = update.message.from_user
     
-    # Инициализируем структуру для отзыва, если ее еще нет
-    if "review" not in user_data[user.id]:
-        user_data[user.id]["review"] = {
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "telegram_id": user.id,
-            "telegram_username": user.username
-        }
+    sessions.pop(user.id)
     
-    user_data[user.id]["review"]["course"] = update.message.text
-    
-    await update.message.reply_text(
-        "2. Кто был вашим тренером?",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return REVIEW_TRAINER
+    return ConversationHandler.END
 
-async def review_trainer(update: Update, context: CallbackContext) -> int:
-    """Тренер пользователя"""
-    user = update.message.from_user
-    user_data[user.id]["review"]["trainer"] = update.message.text
-    
-    await update.message.reply_text(
-        "3. Оцените уровень преподавателей и их подход (по шкале от 1 до 10):",
-        reply_markup=rating_keyboard
+def build_application() -> Application:
+    """Сборка приложения со всеми обработчиками"""
+    storage.init(STORAGE_BACKEND)
+    # Опрос и отзыв; при общем хранилище состояния разговоров сохраняет SharedState
+    local = SESSION_BACKEND == "local"
+    conversations = engine.conversation_handlers(
+        fallbacks=[CommandHandler("cancel", cancel)], persistent=local, timeout=CONVERSATION_TIMEOUT
     )
-    return REVIEW_RATING
-
-async def review_rating(update: Update, context: CallbackContext) -> int:
-    """Оценка пользователя"""
-    user = update.message.from_user
-    rating = update.message.text
-    
-    if not rating.isdigit() or int(rating) < 1 or int(rating) > 10:
-        await update.message.reply_text(
-            "Пожалуйста, введите число от 1 до 10:",
-            reply_markup=rating_keyboard
+    shared = None
+    if not local:
+        backend = SqliteStateBackend(SHARED_STATE_PATH, ttl=SESSION_TTL)
+        shared = SharedState(backend, sessions, conversations)
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .rate_limiter(scheduler)
+        .application_class(
+            OrderedApplication,
+            kwargs={
+                "slow_update_ms": SLOW_UPDATE_MS,
+                "max_concurrent": UPDATE_CONCURRENCY,
+                "shared": shared,
+            },
         )
-        return REVIEW_RATING
+        # Каждое обновление - отдельная задача; порядок и лимит задает OrderedApplication
+        .concurrent_updates(sys.maxsize)
+        .request(api_request("interactive", API_POOL_SIZE))
+        .get_updates_request(api_request("updates", 1))
+    )
+    if local:
+        builder.persistence(SessionPersistence(sessions, update_interval=PERSISTENCE_INTERVAL))
+    if TELEGRAM_API_URL:
+        builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = builder.build()
     
-    user_data[user.id]["review"]["rating"] = int(rating)
+    # Обработчик главного меню
+    application.add_handler(CommandHandler("start", start))
+    admins = filters.User(user_id=ADMIN_IDS)
+    application.add_handler(CommandHandler("profile", profile, filters=admins))
+    application.add_handler(CommandHandler("broadcast", broadcast, filters=admins))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status, filters=admins))
+    application.add_handler(CommandHandler("stats", show_stats, filters=admins))
+    application.add_handler(CommandHandler("export", export_data, filters=admins))
+    application.add_handler(CommandHandler("reload", reload_content, filters=admins))
     
-    await update.message.reply_text(
-        "4. Поделитесь своими эмоциями и личными результатами от курса:",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    return REVIEW_RESULTS
-
-async def review_results(update: Update, context: CallbackContext) -> int:
-    """Результаты от курса"""
-    user = update.message.from_user
-    user_data[user.id]["review"]["results"] = update.message.text
+    # Добавление обработчиков
+    for conversation in conversations:
+        application.add_handler(conversation)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu))
+    application.add_handler(CallbackQueryHandler(expired_button))
     
-    # Добавляем клавиатуру для согласия на публикацию отзыва
-    publication_keyboard = ReplyKeyboardMarkup(
-        [["✅ Согласен(-на)", "❌ Не согласен(-на)"]],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
+    # Время обработчиков по состояниям, размеры очереди и хранилища сессий
+    metrics.instrument_handlers(application)
+    metrics.watch(sessions, writer, scheduler, application)
     
-    await update.message.reply_text(
-        "Я согласен(-на) на размещение моего отзыва на сайте https://phenomeny.by/",
-        reply_markup=publication_keyboard
-    )
-    return REVIEW_PUBLICATION_CONSENT
-
-async def review_publication_consent(update: Update, context: CallbackContext) -> int:
-    """Обработка согласия на публикацию отзыва"""
-    user = update.message.from_user
-    choice = update.message.text
+    # Контрольные точки сессий
+    application.job_queue.run_repeating(checkpoint_job, interval=PERSISTENCE_INTERVAL)
     
-    if choice == "✅ Согласен(-на)":
-        user_data[user.id]["review"]["publication_consent"] = True
-    else:
-        user_data[user.id]["review"]["publication_consent"] = False
+    # Запись брошенных опросов и отзывов
+    application.job_queue.run_repeating(sweep_job, interval=SWEEP_INTERVAL, first=SWEEP_INTERVAL)
     
-    # Сохранение отзыва
-    filename = f"data/Reviews_{datetime.now().strftime('%Y%m')}.xlsx"
-    if save_to_excel(user_data[user.id]["review"], filename):
-        await update.message.reply_text(
-            "✅ Спасибо за оставленный отзыв! До встречи на занятиях!",
-            reply_markup=main_menu_keyboard
+    # Очистка общей базы состояний (при запуске ее чистит SqliteStateBackend)
+    if shared:
+        application.job_queue.run_repeating(
+            shared_cleanup_job, interval=SHARED_CLEANUP_INTERVAL, first=SHARED_CLEANUP_INTERVAL
         )
-    else:
-        await update.message.reply_text(
-            "Спасибо за отзыв! Возникли временные трудности с сохранением. "
-            "Администратор уже уведомлен.",
-            reply_markup=main_menu_keyboard
+    
+    # Перезагрузка текстов при изменении файла
+    if CONTENT_CHECK_INTERVAL:
+        application.job_queue.run_repeating(
+            content_watch_job, interval=CONTENT_CHECK_INTERVAL, first=CONTENT_CHECK_INTERVAL
         )
     
-    # Очищаем данные отзыва
-    if "review" in user_data[user.id]:
-        del user_data[user.id]["review"]
+    # Выгрузка результатов в Excel по расписанию
+    application.job_queue.run_repeating(export_job, interval=EXPORT_INTERVAL, first=EXPORT_INTERVAL)
     
-    return MAIN_MENU
+    return application
 
-async def cancel(update: Update, context: CallbackContext) -> int:
-    """Отмена текущего действия"""
-    user = update.message.from_user
-    logger.info(f"User {user.id} canceled the conversation.")
-    
-    await update.message.reply_text(
-        RESPONSES["cancel"],
-        reply_markup=main_menu_keyboard
+async def run_server(application: Application) -> None:
+    """Прием обновлений своим HTTP-сервером до остановки сигналом.
+
+    В режиме webhook обновления присылает Telegram (вебхук устанавливается, если
+    задан WEBHOOK_URL), в режиме worker - маршрутизатор sharding.py.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    server = WebhookServer(
+        application, webhook_replies, WEBHOOK_PATH, WEBHOOK_SECRET, reply_timeout=WEBHOOK_REPLY_MS / 1000
     )
-    
-    if user.id in user_data:
-        del user_data[user.id]
-    
-    return MAIN_MENU
+    async with application:
+        await post_init(application)
+        await application.start()
+        server.start(WEBHOOK_PORT, WEBHOOK_LISTEN)
+        if BOT_MODE == "webhook" and WEBHOOK_URL:
+            await application.bot.set_webhook(
+                WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+        logger.info(f"Worker {WORKER_ID} listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        await stop.wait()
+        await server.stop()
+        await application.stop()
+        await post_stop(application)
 
 def main() -> None:
     """Запуск бота"""
-    application = Application.builder().token(TOKEN).build()
-    
-    # Обработчик главного меню
-    application.add_handler(CommandHandler("start", start))
-    
-    # Обработчик опроса
-    survey_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^Пройти опрос$"), main_menu)],
-    states={
-        SURVEY_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, survey_name)],
-        SURVEY_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, survey_email)],
-        SURVEY_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, survey_phone)],
-        MAIN_PROGRAM_NOW: [MessageHandler(filters.TEXT & ~filters.COMMAND, main_program_now)],
-        CURRENT_LEVEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, current_level)],
-        CURRENT_TRAINER: [MessageHandler(filters.TEXT & ~filters.COMMAND, current_trainer)],
-        STUDIED_BEFORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, studied_before)],
-        STUDIED_LEVELS: [MessageHandler(filters.TEXT & ~filters.COMMAND, studied_levels)],
-        DESIRED_TRAINER: [MessageHandler(filters.TEXT & ~filters.COMMAND, desired_trainer)],
-        PLAN_STUDY: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_study)],
-        PLANNED_LEVEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, planned_level)],
-        PLANNED_TRAINER: [MessageHandler(filters.TEXT & ~filters.COMMAND, planned_trainer)],
-        SPECIALIZATIONS_NOW: [MessageHandler(filters.TEXT & ~filters.COMMAND, specializations_now)],
-        SPEC_LIST_NOW: [MessageHandler(filters.TEXT & ~filters.COMMAND, spec_list_now)],
-        SPEC_TRAINER_NOW: [MessageHandler(filters.TEXT & ~filters.COMMAND, spec_trainer_now)],
-        SPECIALIZATIONS_BEFORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, specializations_before)],
-        SPEC_LIST_BEFORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, spec_list_before)],
-        SPEC_TRAINER_BEFORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, spec_trainer_before)],
-        EVENTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, events)],
-        EVENTS_OTHER: [MessageHandler(filters.TEXT & ~filters.COMMAND, events_other)],
-        FEEDBACK: [MessageHandler(filters.TEXT & ~filters.COMMAND, feedback)],
-        PRIVACY_POLICY: [MessageHandler(filters.TEXT & ~filters.COMMAND, privacy_policy)],
-        NOTIFICATION_CONSENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, notification_consent)],
-    },
-    fallbacks=[CommandHandler("cancel", cancel)],
-    map_to_parent={MAIN_MENU: MAIN_MENU}
-)
-    
-    # Обработчик отзывов
-    review_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^Оставить отзыв$"), main_menu)],
-    states={
-        REVIEW_COURSE: [MessageHandler(filters.TEXT & ~filters.COMMAND, review_course)],
-        REVIEW_TRAINER: [MessageHandler(filters.TEXT & ~filters.COMMAND, review_trainer)],
-        REVIEW_RATING: [MessageHandler(filters.TEXT & ~filters.COMMAND, review_rating)],
-        REVIEW_RESULTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, review_results)],
-        REVIEW_PUBLICATION_CONSENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, review_publication_consent)],
-    },
-    fallbacks=[CommandHandler("cancel", cancel)],
-    map_to_parent={MAIN_MENU: MAIN_MENU}
-)
-    
-    # Добавление обработчиков
-    application.add_handler(survey_conv)
-    application.add_handler(review_conv)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu))
-    
-    # Запуск бота
-    application.run_polling()
+    application = build_application()
+    if BOT_MODE in ("webhook", "worker"):
+        asyncio.run(run_server(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
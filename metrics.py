@@ -0,0 +1,270 @@
+# metrics.py
+# Метрики бота в формате Prometheus
+
+import time
+import logging
+import contextvars
+from functools import wraps
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_updates")
+
+# Разбивка времени текущего обновления: обработчики и запросы к Bot API
+_trace = contextvars.ContextVar("update_trace", default=None)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время работы обработчика", ["handler", "state"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler", "state"]
+)
+STORAGE_SECONDS = Histogram(
+    "bot_storage_save_seconds", "Время сохранения пачки записей", ["kind"]
+)
+STORAGE_RECORDS = Counter(
+    "bot_storage_records_total", "Сохраненные записи", ["kind", "status"]
+)
+EXPORT_SECONDS = Histogram(
+    "bot_export_seconds", "Время выгрузки в Excel",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+API_SECONDS = Histogram(
+    "bot_api_request_seconds", "Время запросов к Bot API", ["method"]
+)
+API_ERRORS = Counter(
+    "bot_api_errors_total", "Неудачные запросы к Bot API", ["method"]
+)
+API_POOL_SIZE = Gauge(
+    "bot_api_pool_size", "Размер пула соединений с Bot API", ["pool"]
+)
+API_POOL_IN_FLIGHT = Gauge(
+    "bot_api_pool_in_flight", "Запросы в пуле: ожидающие соединения и выполняющиеся", ["pool"]
+)
+API_POOL_WAIT_SECONDS = Histogram(
+    "bot_api_pool_wait_seconds", "Ожидание соединения в пуле (с установкой нового соединения)", ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+API_POOL_CONNECTIONS = Counter(
+    "bot_api_pool_connections_total", "Новые соединения (TCP и TLS) с Bot API", ["pool"]
+)
+API_POOL_TIMEOUTS = Counter(
+    "bot_api_pool_timeouts_total", "Запросы, не дождавшиеся свободного соединения", ["pool"]
+)
+WRITER_QUEUE_DEPTH = Gauge(
+    "bot_writer_queue_depth", "Записи, ожидающие сохранения"
+)
+ACTIVE_SESSIONS = Gauge(
+    "bot_active_sessions", "Сессии в памяти"
+)
+ABANDONED_SESSIONS = Counter(
+    "bot_abandoned_sessions_total", "Брошенные сценарии по вопросу, на котором остановились", ["state"]
+)
+UPDATES_IN_PROGRESS = Gauge(
+    "bot_updates_in_progress", "Обновления в обработке или в очереди своего пользователя"
+)
+SEND_QUEUE_DEPTH = Gauge(
+    "bot_send_queue_depth", "Исходящие запросы, ожидающие отправки", ["priority"]
+)
+SEND_WAIT_SECONDS = Histogram(
+    "bot_send_wait_seconds", "Ожидание исходящего запроса в очереди", ["priority"]
+)
+SEND_RETRIES = Counter(
+    "bot_send_retries_total", "Повторы после 429 Too Many Requests", ["method"]
+)
+WEBHOOK_REPLIES = Counter(
+    "bot_webhook_replies_total", "Ответы меню: в теле ответа на вебхук или запросом к Bot API", ["via"]
+)
+
+
+def _callback_name(callback):
+    """Имя обработчика; для functools.partial - имя исходной функции"""
+    return getattr(callback, "__name__", None) or getattr(callback.func, "__name__", repr(callback))
+
+
+def timed(callback, state):
+    """Обертка обработчика: число вызовов, время и исключения"""
+    name = _callback_name(callback)
+    histogram = HANDLER_SECONDS.labels(name, state)
+    errors = HANDLER_ERRORS.labels(name, state)
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            trace = _trace.get()
+            if trace is not None:
+                trace.handlers.append((name, state, elapsed))
+
+    return wrapper
+
+
+def _instrument_handler(handler, state):
+    if isinstance(handler, ConversationHandler):
+        for entry in handler.entry_points:
+            _instrument_handler(entry, f"{handler.name}.entry")
+        for conversation_state, handlers in handler.states.items():
+            for inner in handlers:
+                _instrument_handler(inner, str(conversation_state))
+        for fallback in handler.fallbacks:
+            _instrument_handler(fallback, f"{handler.name}.fallback")
+    else:
+        handler.callback = timed(handler.callback, state)
+
+
+def instrument_handlers(application):
+    """Оборачивает все обработчики приложения, включая состояния разговоров"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler, "none")
+
+
+def watch(sessions, writer, scheduler, application):
+    """Размеры очередей и хранилища сессий считаются только при запросе метрик"""
+    ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+    UPDATES_IN_PROGRESS.set_function(lambda: application.waiting)
+    WRITER_QUEUE_DEPTH.set_function(lambda: writer.depth)
+    for priority in scheduler.priorities:
+        SEND_QUEUE_DEPTH.labels(priority).set_function(
+            lambda priority=priority: scheduler.queue_depth(priority)
+        )
+
+
+def start_server(port, addr="127.0.0.1"):
+    """HTTP-сервер метрик в отдельном потоке"""
+    start_http_server(port, addr=addr)
+    logger.info(f"Metrics available at http://{addr}:{port}/metrics")
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest со временем каждого запроса к Bot API и метриками пула соединений.
+
+    Ожидание в пуле - от отправки запроса клиентом до начала записи в
+    соединение: очередь за свободным соединением и установка нового (TCP и
+    TLS), если простаивающего нет. keepalive - сколько простаивающих
+    соединений держать открытыми, keepalive_expiry - как долго, секунды.
+    """
+
+    def __init__(self, pool="bot", connection_pool_size=1, keepalive=None, keepalive_expiry=5.0, **kwargs):
+        self.pool = pool
+        self.limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=connection_pool_size if keepalive is None else keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        API_POOL_SIZE.labels(pool).set(connection_pool_size)
+        self._in_flight = API_POOL_IN_FLIGHT.labels(pool)
+        self._wait = API_POOL_WAIT_SECONDS.labels(pool)
+        self._connections = API_POOL_CONNECTIONS.labels(pool)
+
+    def _build_client(self):
+        kwargs = dict(self._client_kwargs, limits=self.limits, event_hooks={"request": [self._on_request]})
+        return httpx.AsyncClient(**kwargs)
+
+    async def _on_request(self, request):
+        """Отметка времени запроса; конец ожидания - по событиям соединения httpcore"""
+        started = time.perf_counter()
+        waiting = True
+
+        async def trace(event, info):
+            nonlocal waiting
+            if not waiting:
+                return
+            if event == "connection.connect_tcp.started":
+                self._connections.inc()
+            elif not event.endswith("send_request_headers.started"):
+                return
+            waiting = False
+            self._wait.observe(time.perf_counter() - started)
+
+        request.extensions["trace"] = trace
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        self._in_flight.inc()
+        try:
+            return await super().do_request(url, method, request_data=request_data, **kwargs)
+        except Exception as e:
+            API_ERRORS.labels(api_method).inc()
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                API_POOL_TIMEOUTS.labels(self.pool).inc()
+            raise
+        finally:
+            self._in_flight.dec()
+            elapsed = time.perf_counter() - started
+            API_SECONDS.labels(api_method).observe(elapsed)
+            trace = _trace.get()
+            if trace is not None:
+                trace.api.append((api_method, elapsed))
+
+
+class UpdateTrace:
+    """Из чего сложилось время обработки одного обновления"""
+
+    __slots__ = ("handlers", "api")
+
+    def __init__(self):
+        # (обработчик, состояние, секунды) и (метод Bot API, секунды)
+        self.handlers = []
+        self.api = []
+
+    def breakdown(self, total):
+        parts = []
+        for name, state, elapsed in self.handlers:
+            parts.append(f"{name}[{state}] {elapsed * 1000:.0f} ms")
+        calls = {}
+        for method, elapsed in self.api:
+            count, seconds = calls.get(method, (0, 0.0))
+            calls[method] = (count + 1, seconds + elapsed)
+        for method, (count, seconds) in calls.items():
+            parts.append(f"api {method} x{count} {seconds * 1000:.0f} ms")
+        other = total - sum(elapsed for _, _, elapsed in self.handlers)
+        parts.append(f"other {other * 1000:.0f} ms")
+        return "; ".join(parts)
+
+
+def update_type(update):
+    """Тип обновления: message, callback_query и т.д."""
+    if isinstance(update, Update):
+        for kind in Update.ALL_TYPES:
+            if getattr(update, kind, None) is not None:
+                return kind
+    return type(update).__name__
+
+
+class TracedApplication(Application):
+    """Application, которое пишет в журнал обновления медленнее порога"""
+
+    def __init__(self, *, slow_update_ms=1000, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_update_threshold = slow_update_ms / 1000
+
+    async def process_update(self, update):
+        trace = UpdateTrace()
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        try:
+            await super().process_update(update)
+        finally:
+            _trace.reset(token)
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.slow_update_threshold:
+                update_id = getattr(update, "update_id", None)
+                slow_logger.warning(
+                    f"Slow update {update_id} ({update_type(update)}) {elapsed * 1000:.0f} ms: "
+                    f"{trace.breakdown(elapsed)}"
+                )
@@ -0,0 +1,86 @@
+# ordering.py
+# Одновременная обработка обновлений разных пользователей с сохранением порядка для каждого
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from telegram import Update
+
+from metrics import TracedApplication
+
+def update_key(update):
+    """Чей это апдейт: пользователь, иначе чат; None - порядок не важен"""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+    return None
+
+
+def conversation_key(update):
+    """Ключ ConversationHandler с настройками по умолчанию (чат, пользователь)"""
+    if update.effective_chat is None or update.effective_user is None:
+        return None
+    return (update.effective_chat.id, update.effective_user.id)
+
+
+class OrderedApplication(TracedApplication):
+    """Application с очередью на каждого пользователя.
+
+    PTB запускает каждое обновление отдельной задачей (concurrent_updates),
+    а здесь обновления одного пользователя выстраиваются за его замком в
+    порядке поступления. Общий лимит max_concurrent берется только после
+    замка, поэтому очередь одного пользователя не занимает места других.
+    Состояния ConversationHandler и сессии одного пользователя при этом
+    никогда не меняются двумя обработчиками одновременно. С shared
+    (shared.SharedState) то же соблюдается между процессами бота.
+    """
+
+    def __init__(self, *, max_concurrent=64, shared=None, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = shared
+        self._limit = asyncio.Semaphore(max_concurrent)
+        # ключ -> [замок, число обновлений, которые его держат или ждут]
+        self._locks = {}
+        self._waiting = 0
+
+    @property
+    def waiting(self):
+        """Число обновлений в обработке или в очереди своего пользователя"""
+        # Читается из потока сервера метрик: обход _locks мог бы застать его изменение
+        return self._waiting
+
+    def user(self, update):
+        """Очередь пользователя обновления: внутри его состояние меняет только вызывающий"""
+        return self.lock(update_key(update), conversation_key(update))
+
+    @asynccontextmanager
+    async def lock(self, key, conversation=None):
+        """Очередь пользователя по ключу update_key; conversation - ключ разговора для shared"""
+        if key is None:
+            async with self._limit:
+                yield
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self._waiting += 1
+        try:
+            async with entry[0]:
+                async with self._limit:
+                    if self.shared is None:
+                        yield
+                    else:
+                        async with self.shared.user(key, conversation):
+                            yield
+        finally:
+            self._waiting -= 1
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def process_update(self, update):
+        async with self.user(update):
+            return await super().process_update(update)
@@ -0,0 +1,230 @@
+# outbound.py
+# Планировщик исходящих сообщений с учетом ограничений Telegram
+
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: ответы пользователям уходят раньше массовых рассылок.
+# Массовые отправки передают rate_limit_args=PRIORITY_BULK.
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Методы, на которые распространяются ограничения на отправку сообщений
+LIMITED_METHODS = {"copyMessage", "forwardMessage", "editMessageText", "editMessageReplyMarkup"}
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self, now):
+        """Через сколько секунд появится токен"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ("chat_id", "future", "enqueued")
+
+    def __init__(self, chat_id, future):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class SendScheduler(BaseRateLimiter):
+    """Общая очередь исходящих запросов бота.
+
+    Отправка разрешается, когда есть токен в общем ведре (лимит бота) и в
+    ведре чата (личные чаты и группы ограничены по-разному). Из ожидающих
+    первым уходит самый ранний запрос высшего приоритета, чат которого
+    готов. Ответ 429 приостанавливает всю отправку на retry_after, после
+    чего запрос повторяется.
+    """
+
+    priorities = PRIORITIES
+
+    def __init__(
+        self,
+        rate=30,
+        burst=30,
+        chat_rate=1,
+        chat_burst=3,
+        group_rate=20 / 60,
+        group_burst=3,
+        max_retries=3,
+        max_chat_buckets=10000,
+    ):
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._global = TokenBucket(rate, burst)
+        self._chat_limits = (chat_rate, chat_burst)
+        self._group_limits = (group_rate, group_burst)
+        self._chats = {}
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._task = None
+
+    async def initialize(self):
+        # ExtBot вызывает initialize при каждой инициализации бота (приложение, Updater)
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for queue in self._queues.values():
+            while queue:
+                request = queue.popleft()
+                if not request.future.done():
+                    request.future.cancel()
+
+    @property
+    def depth(self):
+        """Число запросов, ожидающих отправки"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def try_take(self, chat_id):
+        """Токен для сообщения, которое уходит мимо очереди (в теле ответа на вебхук).
+
+        False - лимит бота или чата сейчас исчерпан, сообщение нужно отправить через очередь.
+        """
+        now = time.monotonic()
+        if now < self._paused_until or self._global.ready_in(now) > 0:
+            return False
+        bucket = self._chat_bucket(chat_id)
+        if bucket.ready_in(now) > 0:
+            return False
+        self._global.take()
+        bucket.take()
+        return True
+
+    def queue_depth(self, priority):
+        """Число ожидающих запросов с данным приоритетом"""
+        return len(self._queues[priority])
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                # Полные ведра ничем не отличаются от новых - их можно забыть
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_full(now)}
+            rate, burst = self._group_limits if chat_id < 0 else self._chat_limits
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst)
+        return bucket
+
+    def _next_ready(self, now):
+        """Первый запрос, который можно отправить сейчас, или время до ближайшего"""
+        delay = None
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            # Запросы, ожидание которых отменили, убираются, когда дойдут до начала очереди
+            while queue and queue[0].future.done():
+                queue.popleft()
+            for index, request in enumerate(queue):
+                if request.future.done():
+                    continue
+                if request.chat_id is None:
+                    wait = 0.0
+                else:
+                    wait = self._chat_bucket(request.chat_id).ready_in(now)
+                if wait == 0:
+                    del queue[index]
+                    return priority, request, None
+                delay = wait if delay is None else min(delay, wait)
+        return None, None, delay
+
+    async def _sleep(self, delay):
+        """Пауза до срока или до нового запроса"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        while True:
+            if not self.depth:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._global.ready_in(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            priority, request, delay = self._next_ready(now)
+            if request is None:
+                if delay is not None:
+                    await self._sleep(delay)
+                continue
+            self._global.take()
+            if request.chat_id is not None:
+                self._chats[request.chat_id].take()
+            metrics.SEND_WAIT_SECONDS.labels(priority).observe(now - request.enqueued)
+            request.future.set_result(None)
+
+    async def _acquire(self, chat_id, priority):
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(_Request(chat_id, future))
+        self._wakeup.set()
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not (endpoint.startswith("send") or endpoint in LIMITED_METHODS):
+            return await callback(*args, **kwargs)
+        priority = rate_limit_args if rate_limit_args in PRIORITIES else PRIORITY_INTERACTIVE
+        chat_id = data.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            # @username канала или запрос без чата - только общий лимит
+            chat_id = None
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                metrics.SEND_RETRIES.labels(endpoint).inc()
+                logger.warning(f"Flood limit on {endpoint}, retrying in {e.retry_after} s")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
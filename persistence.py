@@ -0,0 +1,186 @@
+# persistence.py
+# Сохранение незавершенных анкет и состояний разговоров между перезапусками
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from sessions import SurveySession
+from storage import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPersistence(BasePersistence):
+    """Контрольные точки сессий и состояний ConversationHandler в SQLite.
+
+    На каждой контрольной точке пишутся только изменившиеся с прошлого раза
+    сессии и состояния. При запуске сессии не загружаются целиком: хранилище
+    сессий поднимает их из базы по одной при первом обращении пользователя.
+    """
+
+    def __init__(self, sessions, path=None, update_interval=5):
+        # Данные PTB (user_data, chat_data и т.д.) бот не использует
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=False, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.sessions = sessions
+        self.path = path or os.path.join("data", "sessions.db")
+        self.connection = ThreadConnections(self.path)
+        # (имя разговора, ключ) -> новое состояние, еще не записанное в базу
+        self._pending_conversations = {}
+        # (имя разговора, ключ) -> время последней записи состояния; разговоры,
+        # поднятые из базы при запуске (тайм-аут ConversationHandler для них не запущен)
+        self.restored = {}
+        self._checkpoint_lock = asyncio.Lock()
+        self._create_schema()
+        sessions.loader = self.load_session
+
+    def _create_schema(self):
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(user_id INTEGER PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                "(name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, "
+                "updated REAL NOT NULL, PRIMARY KEY (name, key))"
+            )
+            # Устаревшие записи хранилищу сессий уже не нужны
+            cutoff = time.time() - self.sessions.ttl
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+            conn.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+
+    def load_session(self, user_id):
+        """Чтение одной сессии из базы (для SessionStore.loader)"""
+        row = self.connection().execute(
+            "SELECT state, updated FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.sessions.ttl:
+            return None
+        try:
+            return SurveySession.from_state(json.loads(row[0]))
+        except Exception as e:
+            logger.error(f"Error restoring session of user {user_id}: {e}")
+            return None
+
+    def _write(self, sessions, deleted, conversations):
+        """Запись изменений одной транзакцией (выполняется в потоке)"""
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, state, updated) VALUES (?, ?, ?)",
+                [(user_id, state, now) for user_id, state in sessions],
+            )
+            conn.executemany(
+                "DELETE FROM sessions WHERE user_id = ?", [(user_id,) for user_id in deleted]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state, updated) "
+                "VALUES (?, ?, ?, ?)",
+                [(name, key, state, now) for (name, key), state in conversations if state is not None],
+            )
+            conn.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [(name, key) for (name, key), state in conversations if state is None],
+            )
+
+    async def checkpoint(self):
+        """Запись изменившихся сессий и состояний разговоров"""
+        async with self._checkpoint_lock:
+            changed, deleted = self.sessions.take_changes()
+            conversations = list(self._pending_conversations.items())
+            self._pending_conversations = {}
+            if not (changed or deleted or conversations):
+                return
+            # Сериализуем в цикле событий, пока обработчики не изменили сессии
+            states = [
+                (user_id, json.dumps(session.to_state(), ensure_ascii=False))
+                for user_id, session in changed.items()
+            ]
+            try:
+                await asyncio.to_thread(self._write, states, deleted, conversations)
+            except (sqlite3.Error, OSError) as e:
+                # Вернуть изменения до следующей контрольной точки; более новые изменения не затираются
+                self.sessions.return_changes(changed, deleted)
+                for key, state in conversations:
+                    self._pending_conversations.setdefault(key, state)
+                logger.error(f"Checkpoint failed, will retry: {e}")
+                return
+            logger.debug(
+                f"Checkpoint: {len(states)} sessions, {len(deleted)} deleted, "
+                f"{len(conversations)} conversation states"
+            )
+
+    async def get_conversations(self, name):
+        # Загружаются только состояния, которые еще не истекли
+        cutoff = time.time() - self.sessions.ttl
+        rows = self.connection().execute(
+            "SELECT key, state, updated FROM conversations WHERE name = ? AND updated >= ?", (name, cutoff)
+        )
+        conversations = {}
+        for key, state, updated in rows:
+            # Числовые состояния остались от старой версии бота и больше ничему не соответствуют
+            if isinstance(state, str):
+                key = tuple(json.loads(key))
+                conversations[key] = state
+                self.restored[(name, key)] = updated
+        return conversations
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+
+    async def flush(self):
+        await self.checkpoint()
+
+    # Остальные данные PTB не сохраняются
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,112 @@
+# profiling.py
+# Профилирование работающего бота по запросу администратора или по сигналу
+
+import io
+import os
+import sys
+import pstats
+import logging
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = os.path.join("data", "profiles")
+
+# Режимы: cprofile - детерминированный профиль потока цикла событий (pstats),
+# sample - сэмплирование стеков всех потоков (collapsed stacks для flamegraph)
+MODES = ("cprofile", "sample")
+
+
+class StackSampler:
+    """Периодический снимок стеков всех потоков"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """Формат collapsed stacks: "поток;функция;...;функция число" """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Один сеанс профилирования за раз; результат пишется в data/profiles"""
+
+    def __init__(self, directory=PROFILES_DIR):
+        self.directory = directory
+        self.mode = None
+        self._profile = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self, mode="cprofile"):
+        """Запуск профилирования; False, если оно уже идет"""
+        if self.active:
+            return False
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            profile = StackSampler()
+            profile.start()
+        self._profile, self.mode = profile, mode
+        logger.info(f"Profiling started ({mode})")
+        return True
+
+    def stop(self):
+        """Остановка и запись результата; возвращает путь к файлу или None"""
+        if not self.active:
+            return None
+        profile, mode = self._profile, self.mode
+        self._profile = self.mode = None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        if mode == "cprofile":
+            profile.disable()
+            path = os.path.join(self.directory, f"profile-{stamp}.pstats")
+            profile.dump_stats(path)
+        else:
+            profile.stop()
+            path = os.path.join(self.directory, f"profile-{stamp}.collapsed")
+            profile.dump(path)
+        logger.info(f"Profile saved to {path}")
+        return path
+
+
+def summary(path, limit=15):
+    """Самые дорогие функции из файла pstats (по накопленному времени)"""
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
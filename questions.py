@@ -50,7 +50,9 @@ BLOCK2 = {
         "8. Планируете ли начать обучение по основной программе?"
     ),
     "planned_level": "9. Какую ступень планируете начать?",
-    "planned_trainer": "10. К какому тренеру Вы хотели бы попасть?"
+    "planned_trainer": "10. К какому тренеру Вы хотели бы попасть?",
+    "next_level": "Выберите следующую ступень или нажмите 'Завершить выбор'",
+    "empty_level": "Пожалуйста, выберите хотя бы одну ступень."
 }
 
 # Блок 3 - Специализации
@@ -71,7 +73,9 @@ BLOCK3 = {
         "16. Выберите специализацию(и), которые Вы проходили:\n"
         "(Выберите одну или несколько специализаций, затем 'Завершить выбор')"
     ),
-    "spec_trainer_before": "17. Кто был Ваш тренер?"
+    "spec_trainer_before": "17. Кто был Ваш тренер?",
+    "next_spec": "Выберите следующую специализацию или нажмите 'Завершить выбор'",
+    "empty_spec": "Пожалуйста, выберите хотя бы одну специализацию."
 }
 
 # Блок 4 - Мероприятия
@@ -89,18 +93,30 @@ BLOCK5 = {
     "feedback": (
         "🔹 Блок 5. Пожелания\n\n"
         "18. Что больше всего Вам понравилось? Что можно улучшить?"
+    ),
+    "privacy_policy": (
+        "Пожалуйста, подтвердите:\n\n"
+        "Я подтверждаю, что ознакомлен(а) с Политикой конфиденциальности сайта, "
+        "даю согласие на сбор и обработку моих персональных данных в соответствии с "
+        "Законом Республики Беларусь от 7 мая 2021 года № 99-З «О защите персональных данных».\n"
+        "Подробнее: https://phenomeny.by/privacy_policy"
+    ),
+    "notification_consent": (
+        "Я согласен(-на) на получение уведомлений по электронной почте и SMS, "
+        "связанных с участием в обучающих курсах."
     )
 }
 
 # Отзывы
 REVIEWS = {
     "start": "Пожалуйста, ответьте на несколько вопросов о вашем обучении:",
-    "course_question": "Пожалуйста, ответьте на несколько вопросов о вашем обучении:\n" +\
+    "course_question": "Спасибо за желание оставить отзыв!\n\n" +\
     "1. Какой курс вы проходили и почему выбрали именно его?",
     "trainer_question": "2. Кто был вашим тренером?",
-    "rating_question": "3. Оцените курс от 1 до 10, где 10 - наивысшая оценка:",
+    "rating_question": "3. Оцените уровень преподавателей и их подход (по шкале от 1 до 10):",
     "invalid_rating": "Пожалуйста, введите число от 1 до 10:",
-    "results_question": "4. Каких результатов вы достигли после прохождения курса?",
+    "results_question": "4. Поделитесь своими эмоциями и личными результатами от курса:",
+    "publication_question": "Я согласен(-на) на размещение моего отзыва на сайте https://phenomeny.by/",
 }
 
 # Ответы и подтверждения
@@ -116,7 +132,47 @@ RESPONSES = {
         "Администратор уже уведомлен."
     ),
     "cancel": "Действие отменено. Выберите пункт меню:",
-    "invalid_choice": "Пожалуйста, выберите один из вариантов меню."
+    "invalid_choice": "Пожалуйста, выберите один из вариантов меню.",
+    "privacy_policy_required": "Для продолжения необходимо подтвердить согласие с Политикой конфиденциальности.",
+    "notification_consent_info": "Вы можете в любое время отозвать согласие на уведомления, обратившись в наш центр.",
+    "button_expired": "Этот вопрос уже закрыт.",
+}
+
+# Ответы на команды администратора
+ADMIN_RESPONSES = {
+    "profile_started": "Профилирование ({mode}) запущено на {seconds} с.",
+    "profile_running": "Профилирование уже запущено.",
+    "profile_usage": "Использование: /profile [секунды] [cprofile|sample]",
+    "profile_saved": "Профиль сохранен: {path}",
+    "broadcast_usage": "Использование: /broadcast текст сообщения",
+    "broadcast_running": "Рассылка уже идет. Состояние: /broadcast_status",
+    "broadcast_empty": "Нет пользователей, согласных на уведомления.",
+    "broadcast_started": "Рассылка №{id} запущена: {count} получателей.",
+    "broadcast_status": (
+        "Рассылка №{id}{state}\n"
+        "Доставлено: {delivered}\nЗаблокировали бота: {blocked}\n"
+        "Ошибки: {failed}\nОсталось: {pending}"
+    ),
+    "broadcast_none": "Рассылок еще не было.",
+    "stats_empty": "Отзывов пока нет.",
+    "stats_header": "Отзывов: {reviews}",
+    "stats_trainers": "Тренеры:",
+    "stats_courses": "Курсы:",
+    "stats_line": "{name} — {mean:.1f} ({count})",
+    "stats_detail": "{name}\nСредняя оценка: {mean:.2f} ({count} отзывов)\nОценки: {histogram}",
+    "stats_comments": "Последние отзывы:",
+    "stats_not_found": "Нет отзывов для «{name}».",
+    "export_usage": (
+        "Использование: /export survey|review|incomplete [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [xlsx|csv]\n"
+        "По умолчанию - с начала текущего месяца по сегодня, xlsx."
+    ),
+    "export_started": "Выгрузка {kind} за {start}..{end} запущена, файл придет сюда.",
+    "export_running": "Другая выгрузка еще идет, попробуйте позже.",
+    "export_done": "{kind} за {start}..{end}: {count} строк",
+    "export_failed": "Не удалось выполнить выгрузку, подробности в журнале бота.",
+    "export_too_large": "Файл слишком большой для Telegram ({size} МБ). Попробуйте csv или период короче.",
+    "reload_done": "Тексты и меню обновлены.",
+    "reload_failed": "Не удалось обновить тексты: {error}",
 }
 
 # Ссылки
@@ -134,6 +190,44 @@ CONTACTS = (
     "Телефон: +375291292429"
 )
 
+# Ответы на пункты главного меню
+MENU_ANSWERS = {
+    "events": "Ближайшие мероприятия центра:\n" + LINKS["events"],
+    "contacts": CONTACTS,
+    "payment": "Оплата услуг центра:\n" + LINKS["payment"],
+    "main_program": "Основная программа обучения:\n" + LINKS["education"],
+    "special_programs": "Дополнительные курсы и программы:\n" + LINKS["specializations"],
+}
+
+# Кнопка завершения множественного выбора
+DONE_BUTTON = "Завершить выбор"
+# Вариант "не участвовал" - всегда последняя кнопка мероприятий, даже если новые мероприятия
+# добавлены в OPTIONS["events"] после него
+NO_EVENTS = "Не участвовал"
+# Отметка выбранного варианта на кнопке множественного выбора
+CHOICE_MARK = "✅ "
+
+# Варианты ответов с множественным выбором
+OPTIONS = {
+    "levels": ("1 ступень", "2 ступень", "3 ступень"),
+    "specializations": (
+        "Гештальт-подход в терапии психосоматических расстройств",
+        "Семейная гештальт-терапия",
+        "Гештальт-подход в сексологии",
+        "Гештальт-терапия травматического опыта",
+        "Арт-гештальт: творческая терапия",
+        "Гештальт-терапия в работе с детьми и подростками",
+        "Групповая гештальт-терапия",
+        "Гештальт-терапия в клинической практике",
+    ),
+    "events": (
+        "Летняя интенсивная программа",
+        "Онлайн конференция",
+        "День открытых дверей",
+        NO_EVENTS,
+    ),
+}
+
 # Клавиатуры
 KEYBOARDS = {
     "main_menu": [
@@ -145,24 +239,137 @@ KEYBOARDS = {
         ["Оставить отзыв"],
     ],
     "yes_no": [["Да", "Нет"]],
-    "levels": [["1 ступень"], ["2 ступень"], ["3 ступень"], ["Завершить выбор"]],
-    "specializations": [
-        ["Гештальт-подход в терапии психосоматических расстройств"],
-        ["Семейная гештальт-терапия"],
-        ["Гештальт-подход в сексологии"],
-        ["Гештальт-терапия травматического опыта"],
-        ["Арт-гештальт: творческая терапия"],
-        ["Гештальт-терапия в работе с детьми и подростками"],
-        ["Групповая гештальт-терапия"],
-        ["Гештальт-терапия в клинической практике"],
-        ["Завершить выбор"]
-    ],
-    "events": [
-        ["Летняя интенсивная программа"],
-        ["Онлайн конференция"],
-        ["День открытых дверей"],
-        ["Другое"],
-        ["Не участвовал"]
-    ],
-    "rating": [[str(i) for i in range(1, 6)], [str(i) for i in range(6, 11)]]
-}
\ No newline at end of file
+    "levels": [[option] for option in OPTIONS["levels"]] + [[DONE_BUTTON]],
+    "specializations": [[option] for option in OPTIONS["specializations"]] + [[DONE_BUTTON]],
+    "events": [[option] for option in OPTIONS["events"] if option != NO_EVENTS] + [["Другое"], [NO_EVENTS]],
+    "rating": [[str(i) for i in range(1, 6)], [str(i) for i in range(6, 11)]],
+    "privacy": [["✅ Подтверждаю", "❌ Не подтверждаю"]],
+    "consent": [["✅ Согласен(-на)", "❌ Не согласен(-на)"]],
+}
+
+# Сценарии опроса и отзыва.
+# Вопросы задаются в порядке следования; первый вопрос задается при входе.
+# Поля вопроса:
+#   text     - текст вопроса
+#   type     - тип ответа: text, yes_no, multi, other, rating, consent
+#   keyboard - кнопки под вопросом из KEYBOARDS (без них ответ вводится текстом)
+#   key      - поле записи для ответа (по умолчанию - имя вопроса), одно из sessions.RECORD_FIELDS
+#   next     - следующий вопрос, None - завершение сценария,
+#              для yes_no - словарь ответ -> вопрос ("*" - любой другой ответ)
+# Для multi: options - таблица из OPTIONS для поля key (номер варианта - бит в маске ответа),
+# done - кнопка завершения выбора, repeat - приглашение выбрать еще, empty - ответ на пустой выбор,
+# special - кнопки со своим переходом (exclusive - заменяет весь выбор).
+# Для other: ответ добавляется в поле key по шаблону format.
+FLOWS = {
+    "survey": {
+        "entry": MAIN_MENU_TEXTS["survey"],
+        "record": "survey",
+        "questions": {
+            "name": {"text": BLOCK1["name"], "type": "text", "next": "email"},
+            "email": {"text": BLOCK1["email"], "type": "text", "next": "phone"},
+            "phone": {"text": BLOCK1["phone"], "type": "text", "next": "main_program_now"},
+            "main_program_now": {
+                "text": BLOCK2["main_program_now"], "type": "yes_no", "keyboard": "yes_no",
+                "next": {"да": "current_level", "*": "studied_before"},
+            },
+            "current_level": {
+                "text": BLOCK2["current_level"], "type": "multi", "keyboard": "levels",
+                "options": "levels", "done": DONE_BUTTON,
+                "repeat": BLOCK2["next_level"], "empty": BLOCK2["empty_level"],
+                "next": "current_trainer",
+            },
+            "current_trainer": {
+                "text": BLOCK2["current_trainer"], "type": "text", "next": "specializations_now",
+            },
+            "studied_before": {
+                "text": BLOCK2["studied_before"], "type": "yes_no", "keyboard": "yes_no",
+                "next": {"да": "studied_levels", "*": "plan_study"},
+            },
+            "studied_levels": {
+                "text": BLOCK2["studied_levels"], "type": "multi", "keyboard": "levels",
+                "options": "levels", "done": DONE_BUTTON,
+                "repeat": BLOCK2["next_level"], "empty": BLOCK2["empty_level"],
+                "next": "desired_trainer",
+            },
+            "desired_trainer": {
+                "text": BLOCK2["desired_trainer"], "type": "text", "next": "specializations_now",
+            },
+            "plan_study": {
+                "text": BLOCK2["plan_study"], "type": "yes_no", "keyboard": "yes_no",
+                "next": {"да": "planned_level", "*": "specializations_now"},
+            },
+            "planned_level": {
+                "text": BLOCK2["planned_level"], "type": "text", "keyboard": "levels",
+                "next": "planned_trainer",
+            },
+            "planned_trainer": {
+                "text": BLOCK2["planned_trainer"], "type": "text", "next": "specializations_now",
+            },
+            "specializations_now": {
+                "text": BLOCK3["specializations_now"], "type": "yes_no", "keyboard": "yes_no",
+                "next": {"да": "spec_list_now", "*": "specializations_before"},
+            },
+            "spec_list_now": {
+                "text": BLOCK3["spec_list_now"], "type": "multi", "keyboard": "specializations",
+                "options": "specializations", "done": DONE_BUTTON,
+                "repeat": BLOCK3["next_spec"], "empty": BLOCK3["empty_spec"],
+                "next": "spec_trainer_now",
+            },
+            "spec_trainer_now": {
+                "text": BLOCK3["spec_trainer_now"], "type": "text", "next": "events",
+            },
+            "specializations_before": {
+                "text": BLOCK3["specializations_before"], "type": "yes_no", "keyboard": "yes_no",
+                "next": {"да": "spec_list_before", "*": "events"},
+            },
+            "spec_list_before": {
+                "text": BLOCK3["spec_list_before"], "type": "multi", "keyboard": "specializations",
+                "options": "specializations", "done": DONE_BUTTON,
+                "repeat": BLOCK3["next_spec"], "empty": BLOCK3["empty_spec"],
+                "next": "spec_trainer_before",
+            },
+            "spec_trainer_before": {
+                "text": BLOCK3["spec_trainer_before"], "type": "text", "next": "events",
+            },
+            "events": {
+                "text": BLOCK4["events"], "type": "multi", "keyboard": "events",
+                "options": "events", "repeat": BLOCK4["next_event"],
+                "special": {
+                    "Другое": {"next": "events_other"},
+                    NO_EVENTS: {"next": "feedback", "exclusive": True},
+                },
+            },
+            "events_other": {
+                "text": BLOCK4["events_other"], "type": "other", "key": "events",
+                "format": "Другое: {}", "next": "feedback",
+            },
+            "feedback": {"text": BLOCK5["feedback"], "type": "text", "next": "privacy_policy"},
+            "privacy_policy": {
+                "text": BLOCK5["privacy_policy"], "type": "consent", "keyboard": "privacy",
+                "accept": "✅ Подтверждаю", "key": "privacy_policy_consent",
+                "next": "notification_consent",
+            },
+            "notification_consent": {
+                "text": BLOCK5["notification_consent"], "type": "consent", "keyboard": "consent",
+                "accept": "✅ Согласен(-на)", "next": None,
+            },
+        },
+    },
+    "review": {
+        "entry": MAIN_MENU_TEXTS["review"],
+        "record": "review",
+        "questions": {
+            "course": {"text": REVIEWS["course_question"], "type": "text", "next": "trainer"},
+            "trainer": {"text": REVIEWS["trainer_question"], "type": "text", "next": "rating"},
+            "rating": {
+                "text": REVIEWS["rating_question"], "type": "rating", "keyboard": "rating",
+                "min": 1, "max": 10, "invalid": REVIEWS["invalid_rating"], "next": "results",
+            },
+            "results": {"text": REVIEWS["results_question"], "type": "text", "next": "publication_consent"},
+            "publication_consent": {
+                "text": REVIEWS["publication_question"], "type": "consent", "keyboard": "consent",
+                "accept": "✅ Согласен(-на)", "next": None,
+            },
+        },
+    },
+}
@@ -0,0 +1,406 @@
+# sessions.py
+# Хранение незавершенных анкет пользователей
+
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from questions import FLOWS, OPTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def choice_tables(flows, options):
+    """Таблицы вариантов полей с множественным выбором по вопросам multi сценария опроса"""
+    tables = {}
+    for flow_name, definition in flows.items():
+        if definition["record"] != "survey":
+            continue
+        for name, question in definition["questions"].items():
+            if question["type"] != "multi":
+                continue
+            field = question.get("key", name)
+            if question.get("options") not in options:
+                raise ValueError(f"Unknown options '{question.get('options')}' in question '{flow_name}.{name}'")
+            table = tuple(options[question["options"]])
+            if tables.setdefault(field, table) != table:
+                raise ValueError(f"Field '{field}' has different options in question '{flow_name}.{name}'")
+    return tables
+
+
+# Поля с множественным выбором и их таблицы вариантов; позиция варианта - номер бита в маске.
+# Порядок вариантов менять нельзя - сохраненные маски станут неверными, новые добавляются в конец
+CHOICE_FIELDS = choice_tables(FLOWS, OPTIONS)
+
+
+def check_options(choices, extend_only=True):
+    """Проверка новых таблиц вариантов: набор полей тот же, прежние варианты на своих местах.
+
+    Набор полей задан слотами SurveySession при импорте и без перезапуска не меняется.
+    При запуске (extend_only=False) порядок вариантов не проверяется: маски в хранилище
+    сессий записаны по таблицам из файла текстов, а не из questions.py.
+    """
+    if choices.keys() != CHOICE_FIELDS.keys():
+        raise ValueError("Multiple choice fields were changed, restart the bot to apply")
+    if not extend_only:
+        return
+    for field, current in CHOICE_FIELDS.items():
+        if tuple(choices[field][:len(current)]) != current:
+            raise ValueError(f"Options of '{field}' can only be extended at the end")
+
+
+def set_options(choices):
+    """Подмена таблиц вариантов (после check_options)"""
+    CHOICE_FIELDS.update({field: tuple(options) for field, options in choices.items()})
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ReviewSession:
+    """Ответы незавершенного отзыва"""
+
+    __slots__ = (
+        "started",
+        "telegram_id",
+        "telegram_username",
+        "course",
+        "trainer",
+        "rating",
+        "results",
+        "publication_consent",
+    )
+
+    # поля ответов
+    FIELDS = __slots__[3:]
+
+    def __init__(self, telegram_id, telegram_username):
+        self.started = time.time()
+        self.telegram_id = telegram_id
+        self.telegram_username = telegram_username
+        self.course = None
+        self.trainer = None
+        self.rating = None
+        self.results = None
+        self.publication_consent = None
+
+    def to_record(self):
+        """Запись для сохранения"""
+        record = {
+            "date": _format_time(self.started),
+            "telegram_id": self.telegram_id,
+            "telegram_username": self.telegram_username,
+        }
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                record[name] = value
+        return record
+
+    def to_state(self):
+        """Компактное представление для сохранения между перезапусками"""
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстановление из to_state()"""
+        review = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, state):
+            setattr(review, name, value)
+        return review
+
+
+class SurveySession:
+    """Ответы незавершенного опроса.
+
+    Множественный выбор хранится битовыми масками по таблицам CHOICE_FIELDS;
+    ответы не из таблицы (текст с клавиатуры, "Другое: ...") - в other.
+    """
+
+    TEXT_FIELDS = (
+        "name",
+        "email",
+        "phone",
+        "main_program_now",
+        "current_trainer",
+        "studied_before",
+        "desired_trainer",
+        "plan_study",
+        "planned_level",
+        "planned_trainer",
+        "specializations_now",
+        "spec_trainer_now",
+        "specializations_before",
+        "spec_trainer_before",
+        "feedback",
+        "privacy_policy_consent",
+        "notification_consent",
+    )
+
+    __slots__ = ("started", "telegram_id", "username", "other", "review") + TEXT_FIELDS + tuple(CHOICE_FIELDS)
+
+    def __init__(self, telegram_id, username):
+        self.started = time.time()
+        self.telegram_id = telegram_id
+        self.username = username
+        self.other = None
+        self.review = None
+        for name in self.TEXT_FIELDS:
+            setattr(self, name, None)
+        for name in CHOICE_FIELDS:
+            setattr(self, name, 0)
+
+    def review_record(self):
+        """Ответы отзыва (создаются при первом обращении)"""
+        if self.review is None:
+            self.review = ReviewSession(self.telegram_id, self.username)
+        return self.review
+
+    def add_choice(self, field, text):
+        """Отметка варианта в поле с множественным выбором"""
+        options = CHOICE_FIELDS[field]
+        if text in options:
+            setattr(self, field, getattr(self, field) | 1 << options.index(text))
+            return
+        if self.other is None:
+            self.other = {}
+        answers = self.other.setdefault(field, [])
+        if text not in answers:
+            answers.append(text)
+
+    def toggle_choice(self, field, text):
+        """Отметка варианта или снятие отметки, если он уже выбран"""
+        options = CHOICE_FIELDS[field]
+        if text in options:
+            setattr(self, field, getattr(self, field) ^ 1 << options.index(text))
+        elif self.other and text in self.other.get(field, ()):
+            self.other[field].remove(text)
+        else:
+            self.add_choice(field, text)
+
+    def set_choices(self, field, texts):
+        """Замена выбранных вариантов"""
+        setattr(self, field, 0)
+        if self.other:
+            self.other.pop(field, None)
+        for text in texts:
+            self.add_choice(field, text)
+
+    def has_choices(self, field):
+        """Выбран ли хотя бы один вариант"""
+        return bool(getattr(self, field)) or bool(self.other and self.other.get(field))
+
+    def choices(self, field):
+        """Выбранные варианты списком строк"""
+        mask = getattr(self, field)
+        options = CHOICE_FIELDS[field]
+        texts = [options[bit] for bit in range(len(options)) if mask >> bit & 1]
+        if self.other and field in self.other:
+            texts.extend(self.other[field])
+        return texts
+
+    def to_record(self):
+        """Запись для сохранения; списки объединяются в строки только при выгрузке"""
+        record = {
+            "telegram_id": self.telegram_id,
+            "username": self.username,
+            "date": _format_time(self.started),
+        }
+        for name in self.TEXT_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                record[name] = value
+        for name in CHOICE_FIELDS:
+            if self.has_choices(name):
+                record[name] = self.choices(name)
+        return record
+
+    def to_state(self):
+        """Компактное представление для сохранения между перезапусками"""
+        state = [getattr(self, name) for name in self.__slots__]
+        if self.review is not None:
+            state[self.__slots__.index("review")] = self.review.to_state()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстановление из to_state()"""
+        session = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, state):
+            setattr(session, name, value)
+        if session.review is not None:
+            session.review = ReviewSession.from_state(session.review)
+        return session
+
+
+# Поля записи сценария по его типу record (поле key вопроса)
+RECORD_FIELDS = {
+    "survey": SurveySession.TEXT_FIELDS + tuple(CHOICE_FIELDS),
+    "review": ReviewSession.FIELDS,
+}
+
+
+class SessionStore:
+    """Сессии пользователей с ограничением размера (LRU) и временем простоя (TTL).
+
+    Если задан loader(user_id), сессия, которой нет в памяти, запрашивается
+    у него - так сессии лениво восстанавливаются после перезапуска.
+    """
+
+    def __init__(self, max_size=10000, ttl=6 * 60 * 60, loader=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.loader = loader
+        # user_id -> (сессия, время последнего обращения); порядок - от давних к свежим
+        self._sessions = OrderedDict()
+        # Изменения с прошлой контрольной точки; без контрольных точек (общее хранилище
+        # shared.SharedState) удаления не копятся - их некому забрать
+        self.track_changes = True
+        self._changed = {}
+        self._deleted = set()
+        # Брошенные сценарии, ожидающие записи: (сессия, сценарий, состояние)
+        self._abandoned = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.restores = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def get(self, user_id):
+        """Сессия пользователя или None, если ее нет или она истекла"""
+        entry = self._sessions.get(user_id)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] > self.ttl:
+            self._evict(user_id)
+            self._mark_deleted(user_id)
+            entry = None
+        elif entry is None:
+            # Вытесненная сессия с незаписанными изменениями новее сохраненной копии
+            session = self._changed.get(user_id)
+            if session is None and self.loader is not None:
+                session = self.loader(user_id)
+                if session is not None:
+                    self.restores += 1
+            if session is not None:
+                entry = (session, now)
+                self._sessions[user_id] = entry
+                self._expire()
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._sessions[user_id] = (entry[0], now)
+        self._sessions.move_to_end(user_id)
+        # Сессию берут, чтобы записать ответ - считаем ее измененной
+        self._changed[user_id] = entry[0]
+        return entry[0]
+
+    def start(self, user):
+        """Новая сессия пользователя (старая, если была, заменяется)"""
+        session = SurveySession(user.id, user.username)
+        self._sessions.pop(user.id, None)
+        self._sessions[user.id] = (session, time.monotonic())
+        self._changed[user.id] = session
+        self._deleted.discard(user.id)
+        self._expire()
+        return session
+
+    def get_or_start(self, user):
+        """Сессия пользователя; если ее нет, создается новая"""
+        session = self.get(user.id)
+        if session is None:
+            session = self.start(user)
+        return session
+
+    def pop(self, user_id):
+        """Удаление сессии пользователя"""
+        entry = self._sessions.pop(user_id, None)
+        self._changed.pop(user_id, None)
+        self._mark_deleted(user_id)
+        return entry[0] if entry else None
+
+    def abandon(self, user_id, flow, state):
+        """Снятие сессии брошенного сценария; ответы ждут записи до take_abandoned()"""
+        session = self.pop(user_id)
+        if session is not None:
+            self._abandoned.append((session, flow, state))
+        return session
+
+    def take_abandoned(self):
+        """Брошенные сценарии с прошлого вызова"""
+        abandoned, self._abandoned = self._abandoned, []
+        return abandoned
+
+    def return_abandoned(self, abandoned):
+        """Возврат брошенных сценариев, которые не удалось записать, до следующего take_abandoned()"""
+        self._abandoned[:0] = abandoned
+
+    def restore(self, user_id, session):
+        """Подмена сессии пользователя сохраненной вне процесса (None - удаление); изменением не считается"""
+        self._sessions.pop(user_id, None)
+        self._changed.pop(user_id, None)
+        self._deleted.discard(user_id)
+        if session is not None:
+            self._sessions[user_id] = (session, time.monotonic())
+            self._expire()
+
+    def detach(self, user_id):
+        """Текущая сессия пользователя без учета ее изменений (их сохраняет вызывающий)"""
+        self._changed.pop(user_id, None)
+        self._deleted.discard(user_id)
+        entry = self._sessions.get(user_id)
+        return entry[0] if entry else None
+
+    def take_changes(self):
+        """Сессии, измененные и удаленные с прошлого вызова"""
+        changed, deleted = self._changed, self._deleted
+        self._changed, self._deleted = {}, set()
+        return changed, deleted
+
+    def return_changes(self, changed, deleted):
+        """Возврат изменений, которые не удалось записать, до следующего take_changes()"""
+        for user_id, session in changed.items():
+            if user_id not in self._changed and user_id not in self._deleted:
+                self._changed[user_id] = session
+        for user_id in deleted:
+            if user_id not in self._changed:
+                self._deleted.add(user_id)
+
+    def _mark_deleted(self, user_id):
+        if self.track_changes:
+            self._deleted.add(user_id)
+
+    def _evict(self, user_id):
+        del self._sessions[user_id]
+        self.evictions += 1
+
+    def _expire(self):
+        """Удаление истекших сессий и самых давних сверх лимита"""
+        now = time.monotonic()
+        while self._sessions:
+            user_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access > self.ttl:
+                self._changed.pop(user_id, None)
+                self._mark_deleted(user_id)
+            elif len(self._sessions) <= self.max_size:
+                break
+            # Вытесненная по размеру сессия остается в _changed до контрольной точки
+            self._evict(user_id)
+
+    def stats(self):
+        """Счетчики для мониторинга"""
+        return {
+            "size": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "restores": self.restores,
+            "abandoned": len(self._abandoned),
+        }
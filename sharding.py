@@ -0,0 +1,153 @@
+# sharding.py
+# Распределение вебхука между несколькими процессами бота по telegram_id.
+#
+# Маршрутизатор принимает обновления Telegram и пересылает каждое процессу
+# telegram_id % N; процессы (BOT_MODE=worker) хранят сессии в общем хранилище
+# (SESSION_BACKEND=sqlite), поэтому при смене числа процессов разговор
+# продолжает любой из них:
+#   WORKER_URLS=http://127.0.0.1:8001/telegram,http://127.0.0.1:8002/telegram python sharding.py
+
+import os
+import json
+import asyncio
+import logging
+
+import httpx
+from dotenv import load_dotenv
+from telegram import Bot
+from tornado.web import Application, RequestHandler
+from tornado.httpserver import HTTPServer
+
+from webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(data):
+    """Telegram ID автора обновления (словарь из JSON) или None"""
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+class _RouterHandler(RequestHandler):
+    def initialize(self, router):
+        self.router = router
+
+    async def post(self):
+        if self.router.secret and self.request.headers.get(SECRET_HEADER) != self.router.secret:
+            self.set_status(403)
+            return
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        url = self.router.worker_url(data)
+        try:
+            response = await self.router.client.post(
+                url,
+                content=self.request.body,
+                headers={
+                    "Content-Type": "application/json",
+                    SECRET_HEADER: self.router.secret or "",
+                },
+            )
+        except httpx.HTTPError as e:
+            # Telegram повторит обновление, если ответ не 2xx
+            logger.error(f"Error forwarding update to {url}: {e}")
+            self.set_status(502)
+            return
+        # Ответ процесса (например, сообщение в теле ответа на вебхук) передается Telegram как есть
+        self.set_status(response.status_code)
+        if response.content:
+            self.set_header("Content-Type", response.headers.get("Content-Type", "application/json"))
+            self.write(response.content)
+
+
+class Router:
+    """Прием вебхука и пересылка обновлений процессам бота.
+
+    Обновления одного пользователя всегда попадают в один процесс, пока
+    не меняется список процессов; администраторы - в первый процесс, где
+    выполняются фоновые задачи.
+    """
+
+    def __init__(self, worker_urls, path="telegram", secret=None, admin_ids=()):
+        self.worker_urls = list(worker_urls)
+        self.path = path
+        self.secret = secret
+        self.admin_ids = set(admin_ids)
+        self.client = None
+        self._server = None
+
+    def worker_url(self, data):
+        user_id = update_user_id(data)
+        if user_id is None:
+            index = data.get("update_id", 0) % len(self.worker_urls)
+        elif user_id in self.admin_ids:
+            index = 0
+        else:
+            index = user_id % len(self.worker_urls)
+        return self.worker_urls[index]
+
+    def start(self, port, listen="0.0.0.0"):
+        self.client = httpx.AsyncClient(
+            timeout=30, limits=httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        )
+        app = Application([(rf"/{self.path}/?", _RouterHandler, {"router": self})])
+        self._server = HTTPServer(app)
+        self._server.listen(port, listen)
+        logger.info(f"Routing updates from {listen}:{port}/{self.path} to {len(self.worker_urls)} workers")
+
+    async def stop(self):
+        self._server.stop()
+        await self._server.close_all_connections()
+        await self.client.aclose()
+
+
+async def run_router():
+    load_dotenv()
+    # Адреса процессов бота через запятую; порядок задает шардирование
+    worker_urls = [url.strip() for url in os.getenv("WORKER_URLS", "").split(",") if url.strip()]
+    # Адрес и порт, на которые Telegram присылает вебхук
+    listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    port = int(os.getenv("WEBHOOK_PORT", "8443"))
+    path = os.getenv("WEBHOOK_PATH", "telegram")
+    secret = os.getenv("WEBHOOK_SECRET")
+    # Внешний адрес вебхука; если задан, он устанавливается в Telegram при запуске
+    webhook_url = os.getenv("WEBHOOK_URL")
+    max_connections = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    admin_ids = [int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()]
+    if not worker_urls:
+        raise SystemExit("WORKER_URLS is not set")
+
+    router = Router(worker_urls, path=path, secret=secret, admin_ids=admin_ids)
+    router.start(port, listen)
+    if webhook_url:
+        api_url = os.getenv("TELEGRAM_API_URL")
+        base_url = f"{api_url}/bot" if api_url else "https://api.telegram.org/bot"
+        async with Bot(os.getenv("TELEGRAM_BOT_TOKEN"), base_url=base_url) as bot:
+            await bot.set_webhook(webhook_url, secret_token=secret, max_connections=max_connections)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await router.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+    try:
+        asyncio.run(run_router())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,176 @@
+# shared.py
+# Общее хранилище сессий и состояний разговоров для нескольких процессов бота
+
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from sessions import SurveySession
+from storage import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStateBackend:
+    """Состояние пользователей в общей базе SQLite.
+
+    Состояние пользователя читается и записывается целиком под арендой:
+    acquire() атомарно занимает запись пользователя, release() записывает
+    новое состояние и освобождает ее, только если аренда еще принадлежит
+    этому владельцу. Пока один процесс обрабатывает обновление пользователя,
+    другие ждут; аренда упавшего процесса истекает через lease секунд.
+    Другое хранилище (например, сервер ключ-значение) реализует те же
+    acquire/release/cleanup.
+    """
+
+    def __init__(self, path=None, ttl=6 * 60 * 60, lease=30):
+        self.path = path or os.path.join("data", "shared_state.db")
+        self.ttl = ttl
+        self.lease = lease
+        self.connection = ThreadConnections(self.path, timeout=lease)
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state "
+                "(user_id INTEGER PRIMARY KEY, state TEXT, owner TEXT, "
+                "lease REAL NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+            )
+        self.cleanup()
+
+    def acquire(self, user_id, owner):
+        """Аренда записи пользователя: (True, состояние или None) или (False, None), если она занята"""
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO user_state (user_id, updated) VALUES (?, ?)", (user_id, now)
+            )
+            cursor = conn.execute(
+                "UPDATE user_state SET owner = ?, lease = ? "
+                "WHERE user_id = ? AND (owner IS NULL OR owner = ? OR lease < ?)",
+                (owner, now + self.lease, user_id, owner, now),
+            )
+            if not cursor.rowcount:
+                return False, None
+            state, updated = conn.execute(
+                "SELECT state, updated FROM user_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        # Истекшее состояние считается отсутствующим
+        return True, state if now - updated <= self.ttl else None
+
+    def release(self, user_id, owner, state):
+        """Запись состояния (None - удаление) и освобождение аренды; False, если аренда потеряна"""
+        conn = self.connection()
+        with conn:
+            if state is None:
+                cursor = conn.execute(
+                    "DELETE FROM user_state WHERE user_id = ? AND owner = ?", (user_id, owner)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE user_state SET state = ?, owner = NULL, lease = 0, updated = ? "
+                    "WHERE user_id = ? AND owner = ?",
+                    (state, time.time(), user_id, owner),
+                )
+        return bool(cursor.rowcount)
+
+    def cleanup(self):
+        """Удаление истекших состояний"""
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM user_state WHERE updated < ? AND (owner IS NULL OR lease < ?)",
+                (now - self.ttl, now),
+            )
+        return cursor.rowcount
+
+
+class SharedState:
+    """Сессии и состояния разговоров, общие для процессов бота.
+
+    Перед обработкой обновления состояние пользователя берется из хранилища
+    и подставляется в SessionStore и ConversationHandler этого процесса,
+    после обработки - записывается обратно. Поэтому разговор может
+    продолжить любой процесс, а память процесса служит только рабочей копией.
+    """
+
+    def __init__(self, backend, sessions, handlers):
+        self.backend = backend
+        self.sessions = sessions
+        # Состояние пишется в хранилище после каждого обновления, контрольных точек нет
+        sessions.track_changes = False
+        # Непостоянные ConversationHandler (состояния хранятся здесь, а не в persistence)
+        self.handlers = handlers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.conflicts = 0
+
+    def _load(self, user_id, state, key):
+        """Подстановка состояния пользователя в память процесса"""
+        state = json.loads(state) if state else {}
+        session = state.get("session")
+        self.sessions.restore(user_id, SurveySession.from_state(session) if session else None)
+        keys = {tuple(item) for item in state.get("keys", [])}
+        if key is not None:
+            keys.add(key)
+        conversations = state.get("conversations", {})
+        for handler in self.handlers:
+            stored = {tuple(item[0]): item[1] for item in conversations.get(handler.name, [])}
+            for conversation_key in keys:
+                if conversation_key in stored:
+                    handler._conversations[conversation_key] = stored[conversation_key]
+                else:
+                    handler._conversations.pop(conversation_key, None)
+        return keys
+
+    def _dump(self, user_id, keys):
+        """Состояние пользователя после обработки; None, если его не осталось"""
+        session = self.sessions.detach(user_id)
+        conversations = {}
+        used = set()
+        for handler in self.handlers:
+            items = [
+                [list(conversation_key), handler._conversations[conversation_key]]
+                for conversation_key in keys
+                if conversation_key in handler._conversations
+            ]
+            if items:
+                conversations[handler.name] = items
+                used.update(tuple(item[0]) for item in items)
+        if session is None and not conversations:
+            return None
+        return json.dumps(
+            {
+                "session": session.to_state() if session else None,
+                "conversations": conversations,
+                "keys": [list(conversation_key) for conversation_key in used],
+            },
+            ensure_ascii=False,
+        )
+
+    async def _acquire(self, user_id):
+        delay = 0.005
+        while True:
+            acquired, state = await asyncio.to_thread(self.backend.acquire, user_id, self.owner)
+            if acquired:
+                return state
+            # Обновление пользователя обрабатывает другой процесс
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    @asynccontextmanager
+    async def user(self, user_id, key=None):
+        """Обработка обновления пользователя с его общим состоянием; key - ключ разговора"""
+        state = await self._acquire(user_id)
+        keys = self._load(user_id, state, key)
+        try:
+            yield
+        finally:
+            state = self._dump(user_id, keys)
+            if not await asyncio.to_thread(self.backend.release, user_id, self.owner, state):
+                self.conflicts += 1
+                logger.error(f"Lease for user {user_id} expired, state not saved")
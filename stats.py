@@ -0,0 +1,163 @@
+# stats.py
+# Статистика отзывов по тренерам и курсам
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from collections import deque
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+MIN_RATING = 1
+MAX_RATING = 10
+
+
+def _key(name):
+    """Ключ группировки: без лишних пробелов и без учета регистра"""
+    return " ".join(name.split()).casefold()
+
+
+class Aggregate:
+    """Число отзывов, сумма и распределение оценок, последние комментарии"""
+
+    __slots__ = ("name", "count", "total", "histogram", "comments")
+
+    def __init__(self, name, comments=5):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.histogram = [0] * (MAX_RATING - MIN_RATING + 1)
+        self.comments = deque(maxlen=comments)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, rating, comment):
+        self.count += 1
+        self.total += rating
+        self.histogram[rating - MIN_RATING] += 1
+        if comment:
+            self.comments.append(comment)
+
+    def to_state(self):
+        return [self.name, self.count, self.total, self.histogram, list(self.comments)]
+
+    @classmethod
+    def from_state(cls, state, comments=5):
+        aggregate = cls(state[0], comments)
+        aggregate.count, aggregate.total, aggregate.histogram = state[1], state[2], state[3]
+        aggregate.comments.extend(state[4])
+        return aggregate
+
+
+class ReviewStats:
+    """Агрегаты отзывов, которые обновляются при каждом сохраненном отзыве.
+
+    При запуске берется снимок из data/review_stats.json, если он учитывает
+    столько же отзывов, сколько в хранилище; иначе агрегаты пересчитываются
+    по хранилищу.
+    """
+
+    GROUPS = ("trainer", "course")
+
+    def __init__(self, path=None, comments=5):
+        self.path = path or os.path.join(storage.DATA_DIR, "review_stats.json")
+        self.comments = comments
+        self.reviews = 0
+        self.groups = {group: {} for group in self.GROUPS}
+        self.changed = False
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Учет одного отзыва"""
+        try:
+            rating = int(record.get("rating"))
+        except (TypeError, ValueError):
+            rating = None
+        if rating is not None and not MIN_RATING <= rating <= MAX_RATING:
+            rating = None
+        with self._lock:
+            self.reviews += 1
+            self.changed = True
+            if rating is None:
+                return
+            for group in self.GROUPS:
+                name = record.get(group)
+                if not name:
+                    continue
+                aggregates = self.groups[group]
+                key = _key(str(name))
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = Aggregate(" ".join(str(name).split()), self.comments)
+                aggregate.add(rating, record.get("results"))
+
+    def get(self, group, name):
+        return self.groups[group].get(_key(name))
+
+    def top(self, group):
+        """Агрегаты группы, самые частые сначала"""
+        return sorted(self.groups[group].values(), key=lambda aggregate: -aggregate.count)
+
+    def to_state(self):
+        with self._lock:
+            return {
+                "reviews": self.reviews,
+                "groups": {
+                    group: [aggregate.to_state() for aggregate in aggregates.values()]
+                    for group, aggregates in self.groups.items()
+                },
+            }
+
+    def _load_state(self, state):
+        self.reviews = state["reviews"]
+        for group in self.GROUPS:
+            self.groups[group] = {}
+            for item in state["groups"].get(group, []):
+                aggregate = Aggregate.from_state(item, self.comments)
+                self.groups[group][_key(aggregate.name)] = aggregate
+
+    def save(self):
+        """Запись снимка (выполняется в потоке)"""
+        state = self.to_state()
+        self.changed = False
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".stats-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Снимок, если он актуален, иначе пересчет по хранилищу (выполняется в потоке)"""
+        count = storage.count_records("review")
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["reviews"] == count:
+                self._load_state(state)
+                logger.info(f"Review stats loaded from {self.path} ({count} reviews)")
+                return
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            logger.error(f"Error reading {self.path}: {e}")
+        self.rebuild()
+
+    def refresh(self):
+        """Пересчет, если в хранилище есть отзывы, сохраненные другими процессами бота"""
+        if storage.count_records("review") != self.reviews:
+            self.rebuild()
+
+    def rebuild(self):
+        """Пересчет агрегатов по всем отзывам в хранилище"""
+        with self._lock:
+            self.reviews = 0
+            self.groups = {group: {} for group in self.GROUPS}
+        for record in storage.iter_records("review"):
+            self.add(record)
+        self.save()
+        logger.info(f"Review stats rebuilt from {self.reviews} reviews")
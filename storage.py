@@ -0,0 +1,483 @@
+# storage.py
+# Хранение результатов опросов и отзывов
+
+import os
+import sys
+import json
+import glob
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "data"
+
+# Префиксы файлов для каждого типа записей
+PREFIXES = {
+    "survey": "SurveyResults",
+    "review": "Reviews",
+    "incomplete": "Incomplete",
+}
+
+# Поля, которые заполняют обработчики опроса и отзыва
+FIELDS = {
+    "survey": {
+        "telegram_id": "INTEGER",
+        "username": "TEXT",
+        "date": "TEXT",
+        "name": "TEXT",
+        "email": "TEXT",
+        "phone": "TEXT",
+        "main_program_now": "TEXT",
+        "current_level": "LIST",
+        "current_trainer": "TEXT",
+        "studied_before": "TEXT",
+        "studied_levels": "LIST",
+        "desired_trainer": "TEXT",
+        "plan_study": "TEXT",
+        "planned_level": "TEXT",
+        "planned_trainer": "TEXT",
+        "specializations_now": "TEXT",
+        "spec_list_now": "LIST",
+        "spec_trainer_now": "TEXT",
+        "specializations_before": "TEXT",
+        "spec_list_before": "LIST",
+        "spec_trainer_before": "TEXT",
+        "events": "LIST",
+        "feedback": "TEXT",
+        "privacy_policy_consent": "BOOL",
+        "notification_consent": "BOOL",
+        "timestamp": "TEXT",
+    },
+    "review": {
+        "telegram_id": "INTEGER",
+        "telegram_username": "TEXT",
+        "date": "TEXT",
+        "course": "TEXT",
+        "trainer": "TEXT",
+        "rating": "INTEGER",
+        "results": "TEXT",
+        "publication_consent": "BOOL",
+        "timestamp": "TEXT",
+    },
+    # Брошенные опросы и отзывы: вопрос, на котором остановились, и ответы до него
+    "incomplete": {
+        "telegram_id": "INTEGER",
+        "username": "TEXT",
+        "date": "TEXT",
+        "flow": "TEXT",
+        "state": "TEXT",
+        "answers": "JSON",
+        "timestamp": "TEXT",
+    },
+}
+
+# Таблицы и колонка тренера для индекса
+TABLES = {"survey": "surveys", "review": "reviews", "incomplete": "incomplete"}
+TRAINER_COLUMNS = {"survey": "current_trainer", "review": "trainer"}
+
+# Типы колонок SQLite для типов полей
+SQL_TYPES = {"INTEGER": "INTEGER", "TEXT": "TEXT", "LIST": "TEXT", "JSON": "TEXT", "BOOL": "INTEGER"}
+
+
+def current_month():
+    """Текущий месяц в формате YYYYMM"""
+    return datetime.now().strftime("%Y%m")
+
+
+def journal_path(kind, month=None):
+    """Путь к журналу записей за месяц"""
+    return os.path.join(DATA_DIR, f"{PREFIXES[kind]}_{month or current_month()}.jsonl")
+
+
+def excel_path(kind, month=None):
+    """Путь к Excel-выгрузке за месяц"""
+    return os.path.join(DATA_DIR, f"{PREFIXES[kind]}_{month or current_month()}.xlsx")
+
+
+def prepare_record(data):
+    """Подготовка записи: копия данных и дата заполнения"""
+    record = dict(data)
+    record["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return record
+
+
+def append_records(path, records):
+    """Дозапись записей в журнал одной операцией записи"""
+    payload = "".join(
+        json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records
+    )
+    with open(path, "a+b") as f:
+        # После сбоя последняя строка может быть недописана - начинаем с новой
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                payload = "\n" + payload
+        f.write(payload.encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(path):
+    """Построчное чтение журнала"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Недописанная строка после сбоя - пропускаем
+                logger.warning(f"Skipping broken line {line_no} in {path}")
+
+
+def read_excel_rows(xlsx):
+    """Чтение строк старого Excel-файла"""
+    # openpyxl в режиме чтения, без pandas: бот не должен тянуть его ради переноса
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(xlsx, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            records = [
+                {key: value for key, value in zip(header, row) if key is not None}
+                for row in rows
+                if any(value is not None for value in row)
+            ]
+        finally:
+            workbook.close()
+    except Exception as e:
+        # Поврежденный файл не перезаписываем выгрузкой, а откладываем в сторону
+        corrupt = f"{xlsx[: -len('.xlsx')]}.corrupt-{datetime.now():%Y%m%d%H%M%S}.xlsx"
+        os.replace(xlsx, corrupt)
+        logger.error(f"Error reading existing Excel file {xlsx}, moved to {corrupt}: {e}")
+        return []
+    return records
+
+
+def file_months(kind, extensions=("jsonl", "xlsx")):
+    """Месяцы, для которых в папке данных есть файлы"""
+    prefix = PREFIXES[kind]
+    months = set()
+    for ext in extensions:
+        for path in glob.glob(os.path.join(DATA_DIR, f"{prefix}_*.{ext}")):
+            month = os.path.basename(path)[len(prefix) + 1: -len(ext) - 1]
+            if month.isdigit():
+                months.add(month)
+    return sorted(months)
+
+
+class JournalStore:
+    """Журналы JSON Lines по месяцам"""
+
+    name = "journal"
+
+    def _seed_from_excel(self, kind, month, path):
+        """Перенос строк из существующего Excel-файла в новый журнал (однократно)"""
+        xlsx = excel_path(kind, month)
+        if os.path.exists(path) or not os.path.exists(xlsx):
+            return
+        rows = read_excel_rows(xlsx)
+        if rows:
+            append_records(path, rows)
+            logger.info(f"Journal {path} seeded with {len(rows)} rows from {xlsx}")
+
+    def save_records(self, kind, records, month):
+        path = journal_path(kind, month)
+        self._seed_from_excel(kind, month, path)
+        append_records(path, records)
+
+    def months(self, kind):
+        return file_months(kind, ("jsonl",))
+
+    def iter_records(self, kind, month=None, telegram_id=None, trainer=None):
+        for m in ([month] if month else self.months(kind)):
+            path = journal_path(kind, m)
+            if not os.path.exists(path):
+                continue
+            for record in read_journal(path):
+                if telegram_id is not None and record.get("telegram_id") != telegram_id:
+                    continue
+                if trainer is not None and record.get(TRAINER_COLUMNS[kind]) != trainer:
+                    continue
+                yield record
+
+    def count(self, kind):
+        return sum(1 for _ in self.iter_records(kind))
+
+
+class ThreadConnections:
+    """Соединения с базой SQLite, у каждого потока свое (WAL, synchronous=NORMAL).
+
+    Вызов возвращает соединение текущего потока, поэтому объект подставляется
+    вместо метода: self.connection = ThreadConnections(path).
+    """
+
+    def __init__(self, path, timeout=5.0, row_factory=None):
+        self.path = path
+        self.timeout = timeout
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class SqliteStore:
+    """База SQLite в режиме WAL с индексами по telegram_id, месяцу и тренеру"""
+
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "results.db")
+        self.connection = ThreadConnections(self.path, row_factory=sqlite3.Row)
+        fresh = not os.path.exists(self.path)
+        self._create_schema()
+        if fresh:
+            self._import_files()
+
+    def _create_schema(self):
+        conn = self.connection()
+        with conn:
+            for kind, fields in FIELDS.items():
+                table = TABLES[kind]
+                columns = "".join(
+                    f", {name} {SQL_TYPES[field_type]}" for name, field_type in fields.items()
+                )
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    f"(id INTEGER PRIMARY KEY, month TEXT NOT NULL{columns}, extra TEXT)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_telegram_id ON {table} (telegram_id)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_month ON {table} (month)")
+                if kind in TRAINER_COLUMNS:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {table}_trainer ON {table} ({TRAINER_COLUMNS[kind]})"
+                    )
+
+    def _import_files(self):
+        """Перенос журналов и старых Excel-файлов в новую базу (однократно)"""
+        for kind in FIELDS:
+            for month in file_months(kind):
+                path = journal_path(kind, month)
+                if os.path.exists(path):
+                    rows = list(read_journal(path))
+                else:
+                    rows = read_excel_rows(excel_path(kind, month))
+                if rows:
+                    self.save_records(kind, rows, month)
+                    logger.info(f"Imported {len(rows)} {kind} rows for {month} into {self.path}")
+
+    @staticmethod
+    def _to_row(kind, record, month):
+        """Запись -> значения колонок; неизвестные поля уходят в extra"""
+        fields = FIELDS[kind]
+        row = [month]
+        for name, field_type in fields.items():
+            value = record.get(name)
+            if value is not None and field_type in ("LIST", "JSON"):
+                value = json.dumps(value, ensure_ascii=False)
+            elif value is not None and field_type == "BOOL":
+                value = int(bool(value))
+            row.append(value)
+        extra = {key: value for key, value in record.items() if key not in fields}
+        row.append(json.dumps(extra, ensure_ascii=False, default=str) if extra else None)
+        return row
+
+    @staticmethod
+    def _from_row(kind, row):
+        """Строка таблицы -> запись"""
+        record = {}
+        for name, field_type in FIELDS[kind].items():
+            value = row[name]
+            if value is not None and field_type in ("LIST", "JSON"):
+                value = json.loads(value)
+            elif value is not None and field_type == "BOOL":
+                value = bool(value)
+            record[name] = value
+        if row["extra"]:
+            record.update(json.loads(row["extra"]))
+        return record
+
+    def save_records(self, kind, records, month):
+        columns = ["month", *FIELDS[kind], "extra"]
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {TABLES[kind]} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [self._to_row(kind, record, month) for record in records],
+            )
+
+    def months(self, kind):
+        rows = self.connection().execute(
+            f"SELECT DISTINCT month FROM {TABLES[kind]} ORDER BY month"
+        )
+        return [row[0] for row in rows]
+
+    def iter_records(self, kind, month=None, telegram_id=None, trainer=None):
+        conditions, params = [], []
+        if month is not None:
+            conditions.append("month = ?")
+            params.append(month)
+        if telegram_id is not None:
+            conditions.append("telegram_id = ?")
+            params.append(telegram_id)
+        if trainer is not None:
+            conditions.append(f"{TRAINER_COLUMNS[kind]} = ?")
+            params.append(trainer)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.connection().execute(
+            f"SELECT * FROM {TABLES[kind]}{where} ORDER BY id", params
+        )
+        for row in cursor:
+            yield self._from_row(kind, row)
+
+    def count(self, kind):
+        return self.connection().execute(f"SELECT COUNT(*) FROM {TABLES[kind]}").fetchone()[0]
+
+
+STORES = {
+    "journal": JournalStore,
+    "sqlite": SqliteStore,
+}
+
+_store = None
+_lock = threading.Lock()
+
+# Месяцы, изменившиеся с прошлой выгрузки в Excel
+_dirty = set()
+
+
+def init(backend=None):
+    """Выбор хранилища: journal или sqlite (по умолчанию из STORAGE_BACKEND)"""
+    global _store
+    backend = backend or os.getenv("STORAGE_BACKEND", "sqlite")
+    with _lock:
+        _store = STORES[backend]()
+    logger.info(f"Using {backend} storage")
+    return _store
+
+
+def get_store():
+    """Текущее хранилище"""
+    if _store is None:
+        init()
+    return _store
+
+
+def save_records(kind, items, month=None):
+    """Сохранение пачки записей за месяц одной операцией; ошибка хранилища передается вызывающему"""
+    month = month or current_month()
+    try:
+        get_store().save_records(kind, [prepare_record(data) for data in items], month)
+    except Exception as e:
+        logger.error(f"Error saving {kind} records: {e}")
+        raise
+    with _lock:
+        _dirty.add((kind, month))
+    logger.info(f"{len(items)} {kind} record(s) successfully saved")
+    return True
+
+
+def iter_records(kind, month=None, telegram_id=None, trainer=None):
+    """Записи из хранилища с необязательными фильтрами"""
+    return get_store().iter_records(kind, month=month, telegram_id=telegram_id, trainer=trainer)
+
+
+def count_records(kind):
+    """Число записей в хранилище"""
+    return get_store().count(kind)
+
+
+def notification_recipients():
+    """telegram_id пользователей, согласных на уведомления (по последней анкете)"""
+    consent = {}
+    for record in iter_records("survey"):
+        telegram_id = record.get("telegram_id")
+        if telegram_id is not None:
+            consent[telegram_id] = bool(record.get("notification_consent"))
+    return [telegram_id for telegram_id, agreed in consent.items() if agreed]
+
+
+def export_to_excel(kind, month, filename=None):
+    """Построение Excel-файла за месяц из хранилища"""
+    import pandas as pd
+
+    filename = filename or excel_path(kind, month)
+    rows = []
+    for record in iter_records(kind, month=month):
+        rows.append({
+            key: ", ".join(value) if isinstance(value, list)
+            else json.dumps(value, ensure_ascii=False) if isinstance(value, dict)
+            else value
+            for key, value in record.items()
+        })
+    # Пишем во временный файл и атомарно подменяем выгрузку
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix=".export-", suffix=".xlsx")
+    os.close(fd)
+    try:
+        pd.DataFrame(rows).to_excel(tmp, index=False, engine="openpyxl")
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    logger.info(f"Exported {len(rows)} {kind} rows for {month} to {filename}")
+
+
+def take_dirty():
+    """Месяцы, изменившиеся с прошлой выгрузки; список при этом сбрасывается"""
+    with _lock:
+        dirty = set(_dirty)
+        _dirty.clear()
+    return dirty
+
+
+def mark_dirty(months):
+    """Возврат месяцев в список на выгрузку (например, после неудачной выгрузки)"""
+    with _lock:
+        _dirty.update(months)
+
+
+def export_all(force=False, dirty=None):
+    """Выгрузка в Excel месяцев, изменившихся с прошлой выгрузки (или из dirty)"""
+    store = get_store()
+    if dirty is None:
+        dirty = take_dirty()
+    exported = 0
+    for kind in FIELDS:
+        for month in store.months(kind):
+            if not (force or (kind, month) in dirty or not os.path.exists(excel_path(kind, month))):
+                continue
+            try:
+                export_to_excel(kind, month)
+                exported += 1
+            except Exception as e:
+                logger.error(f"Error exporting {kind} for {month}: {e}")
+    return exported
+
+
+if __name__ == "__main__":
+    # Выгрузка по требованию: python storage.py
+    # Бот запускает выгрузку так же, отдельным процессом, передавая изменившиеся
+    # месяцы: python storage.py survey:202401 review:202401
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+    months = {tuple(arg.split(":", 1)) for arg in sys.argv[1:]}
+    export_all(force=not months, dirty=months)
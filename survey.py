@@ -0,0 +1,413 @@
+# survey.py
+# Движок опроса и отзыва: сценарии из questions.py компилируются в таблицу переходов
+# (ее хранит снимок content.Content и подменяет при перезагрузке текстов).
+#
+# Варианты ответа - инлайн-кнопки под вопросом: нажатие заменяет вопрос следующим
+# в том же сообщении, а при множественном выборе только отмечает вариант на кнопке.
+# Новое сообщение отправляется, только если ответ введен текстом.
+
+import re
+import zlib
+import time
+import asyncio
+import logging
+import warnings
+from functools import partial
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from telegram.ext import (
+    CallbackContext,
+    CallbackQueryHandler,
+    ConversationHandler,
+    MessageHandler,
+    TypeHandler,
+    filters,
+)
+
+from sessions import RECORD_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class Step:
+    """Скомпилированный вопрос сценария"""
+
+    __slots__ = (
+        "state",
+        "flow",
+        "kind",
+        "key",
+        "text",
+        "rows",
+        "buttons",
+        "markup",
+        "next",
+        "branches",
+        "done",
+        "repeat",
+        "empty",
+        "special",
+        "accept",
+        "template",
+        "invalid",
+        "minimum",
+        "maximum",
+        "answer",
+    )
+
+    def __init__(self, state, flow):
+        self.state = state
+        self.flow = flow
+        for name in self.__slots__[2:]:
+            setattr(self, name, None)
+
+
+class Flow:
+    """Скомпилированный сценарий"""
+
+    __slots__ = ("name", "entry", "record", "first", "steps")
+
+    def __init__(self, name, entry, record):
+        self.name = name
+        self.entry = entry
+        self.record = record
+        self.first = None
+        self.steps = []
+
+
+# Обработка ответа по типу вопроса: (шаг, запись, текст) -> (следующий шаг, текст ответа).
+# Следующий шаг None - завершение сценария; текст None - текст следующего вопроса.
+
+def _answer_text(step, record, text):
+    setattr(record, step.key, text)
+    return step.next, None
+
+
+def _answer_yes_no(step, record, text):
+    answer = text.lower()
+    setattr(record, step.key, answer)
+    return step.branches.get(answer, step.next), None
+
+
+def _answer_consent(step, record, text):
+    setattr(record, step.key, text == step.accept)
+    return step.next, None
+
+
+def _answer_multi(step, record, text):
+    if text == step.done:
+        if not record.has_choices(step.key):
+            return step, step.empty
+        return step.next, None
+    special = step.special.get(text)
+    if special is not None:
+        next_step, exclusive = special
+        if exclusive:
+            record.set_choices(step.key, [text])
+        return next_step, None
+    record.add_choice(step.key, text)
+    return step, step.repeat
+
+
+def _answer_other(step, record, text):
+    record.add_choice(step.key, step.template.format(text))
+    return step.next, None
+
+
+def _answer_rating(step, record, text):
+    if not text.isdigit() or not step.minimum <= int(text) <= step.maximum:
+        return step, step.invalid
+    setattr(record, step.key, int(text))
+    return step.next, None
+
+
+ANSWERS = {
+    "text": _answer_text,
+    "yes_no": _answer_yes_no,
+    "consent": _answer_consent,
+    "multi": _answer_multi,
+    "other": _answer_other,
+    "rating": _answer_rating,
+}
+
+
+def button_id(text):
+    """Номер кнопки по ее тексту: после перезагрузки текстов с переставленными
+    кнопками уже показанные кнопки не сменят смысл"""
+    return f"{zlib.crc32(text.encode()):08x}"
+
+
+def inline_markup(step, chosen=(), mark=""):
+    """Инлайн-кнопки шага; данные кнопки - "состояние:button_id(текст)" """
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(
+                f"{mark}{text}" if text in chosen else text,
+                callback_data=f"{step.state}:{button_id(text)}",
+            )
+            for text in row
+        ]
+        for row in step.rows
+    ])
+
+
+def compile_flows(flows, keyboards, choices):
+    """Компиляция сценариев в таблицу состояние -> шаг.
+
+    Состояние - строка "сценарий.вопрос", поэтому сохраненные состояния
+    разговоров остаются верными, даже если вопросы добавляются или меняются местами.
+    choices - таблицы вариантов полей multi (sessions.choice_tables).
+    """
+    table = {}
+    compiled = {}
+
+    # Первый проход: шаги без ссылок
+    for flow_name, definition in flows.items():
+        if definition["record"] not in RECORD_FIELDS:
+            raise ValueError(f"Unknown record '{definition['record']}' in flow '{flow_name}'")
+        flow = Flow(flow_name, definition["entry"], definition["record"])
+        for name, question in definition["questions"].items():
+            step = Step(f"{flow_name}.{name}", flow)
+            step.kind = question["type"]
+            step.answer = ANSWERS[step.kind]
+            step.key = question.get("key", name)
+            # multi и other пишут в маску поля с таблицей вариантов, остальные - в обычное поле
+            if step.key not in RECORD_FIELDS[flow.record] or (step.key in choices) != (step.kind in ("multi", "other")):
+                raise ValueError(f"Invalid key '{step.key}' for {step.kind} question '{step.state}'")
+            step.text = question["text"]
+            if "keyboard" in question:
+                step.rows = keyboards[question["keyboard"]]
+                step.buttons = {button_id(text): text for row in step.rows for text in row}
+                if len(step.buttons) != sum(len(row) for row in step.rows):
+                    raise ValueError(f"Duplicate buttons in question '{step.state}'")
+                step.markup = inline_markup(step)
+            step.done = question.get("done")
+            step.repeat = question.get("repeat")
+            step.empty = question.get("empty")
+            step.accept = question.get("accept")
+            step.template = question.get("format")
+            step.invalid = question.get("invalid")
+            step.minimum = question.get("min")
+            step.maximum = question.get("max")
+            table[step.state] = step
+            flow.steps.append(step)
+        flow.first = flow.steps[0]
+        compiled[flow_name] = flow
+
+    # Второй проход: переходы между шагами
+    def resolve(flow_name, target):
+        if target is None:
+            return None
+        if f"{flow_name}.{target}" not in table:
+            raise ValueError(f"Unknown question '{target}' in flow '{flow_name}'")
+        return table[f"{flow_name}.{target}"]
+
+    for flow_name, definition in flows.items():
+        for name, question in definition["questions"].items():
+            step = table[f"{flow_name}.{name}"]
+            next_ = question.get("next")
+            if isinstance(next_, dict):
+                step.branches = {
+                    answer: resolve(flow_name, target)
+                    for answer, target in next_.items() if answer != "*"
+                }
+                step.next = resolve(flow_name, next_.get("*"))
+            else:
+                step.next = resolve(flow_name, next_)
+            step.special = {
+                text: (resolve(flow_name, action["next"]), action.get("exclusive", False))
+                for text, action in question.get("special", {}).items()
+            }
+    return compiled, table
+
+
+class _EntryFilter(filters.MessageFilter):
+    """Кнопка входа в сценарий по текущему снимку текстов"""
+
+    __slots__ = ("content", "flow_name")
+
+    def __init__(self, content, flow_name):
+        super().__init__(name=f"entry({flow_name})")
+        self.content = content
+        self.flow_name = flow_name
+
+    def filter(self, message):
+        return message.text == self.content.current.flows[self.flow_name].entry
+
+
+class SurveyEngine:
+    """Один обработчик для всех вопросов: состояние разговора - ключ в таблице шагов.
+
+    Сценарии берутся из content.current (content.ContentStore) при каждом
+    обновлении, поэтому перезагрузка текстов действует на ближайший же вопрос.
+    """
+
+    def __init__(self, content, sessions, on_finish):
+        # on_finish(flow, update, session) - сохранение и ответ по завершении сценария
+        self.content = content
+        self.sessions = sessions
+        self.on_finish = on_finish
+        # Сценарий -> ConversationHandler (заполняет conversation_handlers)
+        self.handlers = {}
+        self._remove = ReplyKeyboardRemove()
+
+    def _record(self, flow, session):
+        """Запись, в которую попадают ответы сценария"""
+        if flow.record == "review":
+            return session.review_record()
+        return session
+
+    def _markup(self, step, record):
+        """Кнопки шага; при множественном выборе выбранные варианты отмечены"""
+        if step.kind == "multi":
+            return inline_markup(step, set(record.choices(step.key)), self.content.current.choice_mark)
+        return step.markup
+
+    async def enter(self, update: Update, context: CallbackContext, flow_name):
+        """Вход в сценарий: новая запись и первый вопрос"""
+        flow = self.content.current.flows[flow_name]
+        user = update.message.from_user
+        if flow.record == "review":
+            session = self.sessions.get_or_start(user)
+            session.review = None
+        else:
+            session = self.sessions.start(user)
+        markup = self._markup(flow.first, self._record(flow, session)) or self._remove
+        await update.message.reply_text(flow.first.text, reply_markup=markup)
+        return flow.first.state
+
+    async def handle(self, update: Update, context: CallbackContext, state):
+        """Ответ на текущий вопрос текстом"""
+        step = self.content.current.table[state]
+        message = update.message
+        session = self.sessions.get_or_start(message.from_user)
+        record = self._record(step.flow, session)
+        next_step, reply = step.answer(step, record, message.text)
+        if next_step is None:
+            await self.on_finish(step.flow, update, session)
+            return ConversationHandler.END
+        markup = self._markup(next_step, record) or self._remove
+        await message.reply_text(reply or next_step.text, reply_markup=markup)
+        return next_step.state
+
+    async def press(self, update: Update, context: CallbackContext, state):
+        """Ответ на текущий вопрос кнопкой: вопрос в том же сообщении сменяется следующим"""
+        step = self.content.current.table[state]
+        query = update.callback_query
+        text = step.buttons.get(query.data.rsplit(":", 1)[1]) if step.buttons else None
+        if text is None:
+            # Кнопка из старой версии текстов
+            await query.answer()
+            return state
+        session = self.sessions.get_or_start(query.from_user)
+        record = self._record(step.flow, session)
+        if step.kind == "multi" and text != step.done and text not in step.special:
+            record.toggle_choice(step.key, text)
+            await query.answer()
+            await query.edit_message_reply_markup(self._markup(step, record))
+            return state
+        next_step, reply = step.answer(step, record, text)
+        if next_step is step:
+            # Ответ не принят (например, ничего не выбрано) - вопрос остается прежним
+            await query.answer(reply, show_alert=True)
+            return state
+        await query.answer()
+        if next_step is None:
+            await self.on_finish(step.flow, update, session)
+            return ConversationHandler.END
+        await query.edit_message_text(next_step.text, reply_markup=self._markup(next_step, record))
+        return next_step.state
+
+    async def expire(self, update: Update, context: CallbackContext, flow_name):
+        """Нет ответа дольше conversation_timeout: сессия снимается вместе с вопросом, на котором остановились"""
+        handler = self.handlers[flow_name]
+        key = (update.effective_chat.id, update.effective_user.id)
+        async with context.application.user(update):
+            if key in handler.timeout_jobs:
+                # Пока ждали блокировку, пользователь ответил и получил новый тайм-аут.
+                # После возврата PTB все равно завершит разговор - возвращаем состояние
+                # следующим шагом цикла событий, раньше следующего обновления
+                asyncio.get_running_loop().call_soon(handler._update_state, handler._conversations.get(key), key)
+                return
+            self._abandon(flow_name, key)
+
+    async def expire_restored(self, application, restored, timeout):
+        """Брошенные разговоры из restored: (сценарий, ключ) -> время последнего ответа.
+
+        Разговорам, поднятым из persistence после перезапуска, ConversationHandler
+        тайм-аут не назначает, пока пользователь не ответит; их проверяет эта функция.
+        """
+        now = time.time()
+        for (flow_name, key), updated in list(restored.items()):
+            handler = self.handlers.get(flow_name)
+            if handler is None or key in handler.timeout_jobs or key not in handler._conversations:
+                # Разговор продолжен или завершен - дальше за ним следит ConversationHandler
+                del restored[(flow_name, key)]
+                continue
+            if now - updated < timeout:
+                continue
+            del restored[(flow_name, key)]
+            async with application.lock(key[1], key):
+                if key not in handler.timeout_jobs:
+                    self._abandon(flow_name, key)
+
+    def _abandon(self, flow_name, key):
+        """Снятие разговора и сессии пользователя в брошенные"""
+        # Состояние снимаем сами, чтобы при общем хранилище оно не сохранилось
+        state = self.handlers[flow_name]._conversations.pop(key, None)
+        # get() поднимает сессию из persistence, если ее еще нет в памяти
+        if state is not None and self.sessions.get(key[1]) is not None:
+            self.sessions.abandon(key[1], flow_name, state)
+
+    def partial_record(self, flow_name, session, state):
+        """Запись брошенного сценария: вопрос, на котором остановились, и ответы до него"""
+        flow = self.content.current.flows[flow_name]
+        answers = self._record(flow, session).to_record()
+        return {
+            "telegram_id": answers.pop("telegram_id"),
+            "username": answers.pop("username", None) or answers.pop("telegram_username", None),
+            "date": answers.pop("date"),
+            "flow": flow_name,
+            "state": state,
+            "answers": answers,
+        }
+
+    def _step_handlers(self, step):
+        # Кнопки принимаются у каждого шага: после перезагрузки текстов они могут появиться у любого
+        return [
+            MessageHandler(filters.TEXT & ~filters.COMMAND, partial(self.handle, state=step.state)),
+            CallbackQueryHandler(
+                partial(self.press, state=step.state),
+                pattern=rf"^{re.escape(step.state)}:([0-9a-f]{{8}})$",
+            ),
+        ]
+
+    def conversation_handlers(self, fallbacks, persistent=True, timeout=None):
+        """ConversationHandler для каждого сценария.
+
+        persistent - состояния сохраняет persistence приложения; timeout -
+        через сколько секунд без ответа сценарий считается брошенным (expire).
+        """
+        handlers = []
+        for flow in self.content.current.flows.values():
+            states = {step.state: self._step_handlers(step) for step in flow.steps}
+            if timeout:
+                states[ConversationHandler.TIMEOUT] = [TypeHandler(Update, partial(self.expire, flow_name=flow.name))]
+            with warnings.catch_warnings():
+                # Разговор ведется по чату и пользователю, а не по сообщению: кнопки
+                # несут состояние своего вопроса, нажатия старых кнопок не совпадут
+                warnings.filterwarnings("ignore", message="If 'per_message=False'")
+                handler = ConversationHandler(
+                    entry_points=[MessageHandler(
+                        filters.TEXT & _EntryFilter(self.content, flow.name),
+                        partial(self.enter, flow_name=flow.name),
+                    )],
+                    states=states,
+                    fallbacks=fallbacks,
+                    name=flow.name,
+                    persistent=persistent,
+                    conversation_timeout=timeout or None,
+                )
+            self.handlers[flow.name] = handler
+            handlers.append(handler)
+        return handlers
@@ -0,0 +1,116 @@
+# webhook.py
+# Прием обновлений по HTTP с ответом в теле ответа на вебхук
+
+import json
+import asyncio
+import logging
+
+from telegram import Update
+from tornado.web import Application, RequestHandler
+from tornado.httpserver import HTTPServer
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookReplies:
+    """Ответы, которые уходят в Telegram телом ответа на вебхук.
+
+    Пока сервер ждет обработки обновления, обработчик может положить сюда
+    одно сообщение - тогда отдельный запрос к Bot API не нужен. Если
+    обновление пришло не через вебхук или ответ на вебхук уже отдан,
+    сообщение отправляется обычным запросом.
+
+    expects(update) - может ли обработчик ответить на обновление так: только
+    такие обновления держат соединение вебхука. limiter (SendScheduler)
+    учитывает эти ответы в лимитах чата; если лимит исчерпан, ответ уходит
+    обычным запросом через очередь.
+    """
+
+    def __init__(self, expects=None, limiter=None):
+        self.expects = expects or (lambda update: False)
+        self.limiter = limiter
+        # update_id -> ответ (None - обработчик еще не ответил)
+        self._slots = {}
+
+    def open(self, update):
+        """Ожидание ответа на обновление; False - ответа в теле не будет"""
+        if not self.expects(update):
+            return False
+        self._slots[update.update_id] = None
+        return True
+
+    def close(self, update):
+        """Ответ для тела ответа на вебхук; после этого reply() отправляет сообщения сам"""
+        return self._slots.pop(update.update_id, None)
+
+    async def reply(self, update, text, reply_markup=None):
+        """Ответ на сообщение пользователя: в ответе на вебхук, если можно, иначе sendMessage"""
+        chat_id = update.effective_chat.id
+        if (
+            update.update_id in self._slots
+            and self._slots[update.update_id] is None
+            and (self.limiter is None or self.limiter.try_take(chat_id))
+        ):
+            body = {"method": "sendMessage", "chat_id": chat_id, "text": text}
+            if reply_markup is not None:
+                body["reply_markup"] = reply_markup.to_dict()
+            self._slots[update.update_id] = body
+            metrics.WEBHOOK_REPLIES.labels("webhook").inc()
+            return
+        metrics.WEBHOOK_REPLIES.labels("api").inc()
+        await update.effective_message.reply_text(text, reply_markup=reply_markup)
+
+
+class _WebhookHandler(RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    async def post(self):
+        server = self.server
+        if server.secret and self.request.headers.get(SECRET_HEADER) != server.secret:
+            self.set_status(403)
+            return
+        try:
+            update = Update.de_json(json.loads(self.request.body), server.application.bot)
+        except ValueError:
+            self.set_status(400)
+            return
+        waiting = server.replies.open(update)
+        task = server.application.create_task(server.application.process_update(update), update=update)
+        if not waiting:
+            # Ответить в теле нельзя - соединение Telegram сразу освобождается
+            return
+        # Ждем обработку недолго: медленные обработчики не должны занимать соединения Telegram
+        await asyncio.wait({task}, timeout=server.reply_timeout)
+        reply = server.replies.close(update)
+        if reply is not None:
+            self.set_header("Content-Type", "application/json")
+            self.write(json.dumps(reply, ensure_ascii=False))
+
+
+class WebhookServer:
+    """HTTP-сервер обновлений: вебхук Telegram или пересылка от маршрутизатора sharding.py.
+
+    Каждое обновление обрабатывается приложением сразу (порядок и лимит
+    задает OrderedApplication). Если на обновление можно ответить в теле
+    (WebhookReplies.expects), сервер ждет обработку до reply_timeout секунд.
+    """
+
+    def __init__(self, application, replies, path="telegram", secret=None, reply_timeout=0.5):
+        self.application = application
+        self.replies = replies
+        self.secret = secret
+        self.reply_timeout = reply_timeout
+        app = Application([(rf"/{path}/?", _WebhookHandler, {"server": self})])
+        self._server = HTTPServer(app)
+
+    def start(self, port, listen="127.0.0.1"):
+        self._server.listen(port, listen)
+
+    async def stop(self):
+        self._server.stop()
+        await self._server.close_all_connections()
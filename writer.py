@@ -0,0 +1,155 @@
+# writer.py
+# Фоновая запись результатов вне цикла событий бота
+
+import copy
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Submission:
+    """Запись, ожидающая сохранения, и ее статус"""
+    kind: str
+    data: dict
+    chat_id: int = None
+    status: str = "pending"
+    error: str = None
+    created: datetime = field(default_factory=datetime.now)
+
+
+class SubmissionWriter:
+    """Очередь сохранений, которую пачками записывает отдельный поток.
+
+    Записи копятся отдельно для каждого файла журнала и сбрасываются одной
+    записью на диск, как только их набралось batch_size или с момента
+    первой из них прошло batch_timeout_ms миллисекунд.
+    """
+
+    def __init__(self, on_result=None, batch_size=50, batch_timeout_ms=200):
+        # on_result(submission) вызывается после каждой попытки сохранения
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout_ms / 1000
+        self.queue = None
+        self._pending = {}
+        self._deadlines = {}
+        self._task = None
+        self._executor = None
+        # Задачи on_result, еще не завершенные
+        self._callbacks = set()
+
+    async def start(self):
+        """Запуск фоновой задачи записи"""
+        self.queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self._task = asyncio.create_task(self._run())
+        logger.info("Submission writer started")
+
+    def submit(self, kind, data, chat_id=None):
+        """Постановка записи в очередь; данные копируются на момент вызова"""
+        submission = Submission(kind=kind, data=copy.deepcopy(data), chat_id=chat_id)
+        self.queue.put_nowait(submission)
+        return submission
+
+    async def save_batch(self, kind, records):
+        """Запись готовой пачки одной операцией в потоке записи, минуя очередь; True, если сохранена"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            ok = await loop.run_in_executor(self._executor, storage.save_records, kind, records)
+        except Exception:
+            ok = False
+        metrics.STORAGE_SECONDS.labels(kind).observe(time.perf_counter() - started)
+        metrics.STORAGE_RECORDS.labels(kind, "saved" if ok else "failed").inc(len(records))
+        return ok
+
+    @property
+    def depth(self):
+        """Число записей, еще не сброшенных на диск"""
+        if self.queue is None:
+            return 0
+        # sum(map(...)) не отпускает GIL, поэтому безопасно и из потока сервера метрик
+        return self.queue.qsize() + sum(map(len, self._pending.values()))
+
+    async def _run(self):
+        while True:
+            timeout = None
+            if self._deadlines:
+                timeout = max(0, min(self._deadlines.values()) - time.monotonic())
+            try:
+                submission = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                submission = False
+
+            if submission is None:
+                # Сигнал остановки: сбрасываем все, что накопилось
+                for key in list(self._pending):
+                    await self._flush(key)
+                self.queue.task_done()
+                return
+
+            if submission:
+                key = (submission.kind, submission.created.strftime("%Y%m"))
+                self._pending.setdefault(key, []).append(submission)
+                self._deadlines.setdefault(key, time.monotonic() + self.batch_timeout)
+                self.queue.task_done()
+
+            now = time.monotonic()
+            for key in list(self._pending):
+                if len(self._pending[key]) >= self.batch_size or self._deadlines[key] <= now:
+                    await self._flush(key)
+
+    async def _flush(self, key):
+        """Запись накопленной пачки одного журнала"""
+        batch = self._pending.pop(key)
+        del self._deadlines[key]
+        kind, month = key
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            ok = await loop.run_in_executor(
+                self._executor, storage.save_records, kind, [s.data for s in batch], month
+            )
+            error = None
+        except Exception as e:
+            ok, error = False, str(e)
+        metrics.STORAGE_SECONDS.labels(kind).observe(time.perf_counter() - started)
+        metrics.STORAGE_RECORDS.labels(kind, "saved" if ok else "failed").inc(len(batch))
+        for submission in batch:
+            submission.status = "saved" if ok else "failed"
+            submission.error = error
+            if self.on_result:
+                # Отдельной задачей: отправка сообщений не должна задерживать запись следующих пачек
+                task = asyncio.create_task(self._notify(submission))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+
+    async def _notify(self, submission):
+        try:
+            await self.on_result(submission)
+        except Exception as e:
+            logger.error(f"Error in writer callback: {e}")
+
+    async def stop(self):
+        """Дожидается записи всей очереди и останавливает поток"""
+        if self._task is None:
+            return
+        pending = self.depth
+        if pending:
+            logger.info(f"Draining {pending} pending submissions")
+        await self.queue.put(None)
+        await self._task
+        if self._callbacks:
+            await asyncio.gather(*self._callbacks)
+        self._executor.shutdown(wait=True)
+        self._task = None
+        logger.info("Submission writer stopped")